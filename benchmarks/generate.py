@@ -0,0 +1,133 @@
+import argparse
+import random
+from pathlib import Path
+from typing import List, Union
+
+# smallest valid png, 1x1 pixel
+PNG_BYTES = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)
+
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+    "incididunt ut labore et dolore magna aliqua enim ad minim veniam quis nostrud"
+).split()
+
+
+def generate_site(
+        root: Union[str, Path],
+        pages: int = 100,
+        paragraphs: int = 10,
+        headings: int = 3,
+        links: int = 5,
+        images: int = 2,
+        css_files: int = 2,
+        templated: bool = True,
+        seed: int = 23,
+) -> List[Path]:
+    """
+    Write a synthetic site of markdown pages, images and stylesheets.
+
+    :param root: output directory
+    :param pages: int, number of pages
+    :param paragraphs: int, number of paragraphs per page
+    :param headings: int, number of sub-headings per page
+    :param links: int, number of links to other pages per page
+    :param images: int, number of images per page, taken from a shared pool of images
+    :param css_files: int, number of stylesheets in the front-matter of each page
+    :param templated: bool, use front-matter context variables, a jinja loop
+        and an extended template in the pages
+    :param seed: int, random seed
+    :return: list of page filenames
+    """
+    rng = random.Random(seed)
+    root = Path(root)
+    (root / "images").mkdir(parents=True, exist_ok=True)
+    (root / "css").mkdir(parents=True, exist_ok=True)
+
+    image_names = [f"images/image-{i}.png" for i in range(max(1, pages // 10 * images))]
+    for name in image_names:
+        (root / name).write_bytes(PNG_BYTES)
+
+    css_names = [f"css/style-{i}.css" for i in range(max(1, css_files * 2))]
+    for i, name in enumerate(css_names):
+        (root / name).write_text(f"body {{ margin: {i}px; }}\n")
+
+    if templated:
+        (root / "bench-base.md").write_text(
+            "# {{ title }}\n\n{% block content %}{% endblock %}\n\n---\n(generated by {{ author }})\n"
+        )
+
+    def _sentence(num_words: int) -> str:
+        return " ".join(rng.choice(WORDS) for _ in range(num_words)).capitalize() + "."
+
+    filenames = []
+    for page_index in range(pages):
+        lines = [
+            "---",
+            f"title: Page {page_index}",
+        ]
+        if css_files:
+            lines.append("css:")
+            for name in rng.sample(css_names, min(css_files, len(css_names))):
+                lines.append(f"  - {name}")
+        if templated:
+            lines += [
+                "context:",
+                "  author: Bench",
+                "  items:",
+            ] + [f"    - {_sentence(2)}" for _ in range(3)]
+        lines.append("---")
+
+        if templated:
+            lines += ["{% extends 'bench-base.md' %}", "{% block content %}"]
+        else:
+            lines += [f"# Page {page_index}", ""]
+
+        for p in range(paragraphs):
+            if headings and p % max(1, paragraphs // headings) == 0:
+                lines += [f"## Section {p}", ""]
+
+            paragraph = _sentence(rng.randint(20, 60))
+            if p < links:
+                paragraph += f" See [page {p}](page-{rng.randrange(pages)}.md)."
+            if p < images:
+                name = rng.choice(image_names)
+                paragraph += f" ![image {p}]({name})"
+            lines += [paragraph, ""]
+
+        lines += ["```python", "print('[not a link](page-0.md)')", "```", ""]
+
+        if templated:
+            lines += ["{% for item in items %}- {{ item }}", "{% endfor %}", "{% endblock %}"]
+
+        filename = root / f"page-{page_index}.md"
+        filename.write_text("\n".join(lines) + "\n")
+        filenames.append(filename)
+
+    return filenames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic site for benchmarks")
+    parser.add_argument("output", type=str, help="Output directory")
+    parser.add_argument("-p", "--pages", type=int, default=100)
+    parser.add_argument("--paragraphs", type=int, default=10)
+    parser.add_argument("--headings", type=int, default=3)
+    parser.add_argument("--links", type=int, default=5)
+    parser.add_argument("--images", type=int, default=2)
+    parser.add_argument("--css-files", type=int, default=2)
+    parser.add_argument("--no-template", action="store_true")
+    args = parser.parse_args()
+
+    filenames = generate_site(
+        args.output, pages=args.pages, paragraphs=args.paragraphs, headings=args.headings,
+        links=args.links, images=args.images, css_files=args.css_files,
+        templated=not args.no_template,
+    )
+    print(f"Generated {len(filenames)} pages in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
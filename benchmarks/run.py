@@ -0,0 +1,152 @@
+import argparse
+import json
+import platform
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+import jinja2
+import marko
+from marko import Markdown, HTMLRenderer
+
+from impro.pages import Page
+from impro.pages.frontmatter import split_front_matter_and_markup, read_front_matter
+from impro.pages.md import replace_markdown_links, LinkReplaceHTMLRenderer
+from impro.site import Site
+from impro.writer import FileWriter
+
+from .generate import generate_site
+
+
+def run_benchmarks(
+        pages: int = 100,
+        repeat: int = 3,
+        formats: Tuple[str, ...] = ("md", "html"),
+        **generate_kwargs,
+) -> dict:
+    """
+    Generate a synthetic site and time each build stage.
+
+    Each stage is run ``repeat`` times over all pages and the fastest run is reported.
+
+    :return: dict with "meta" and "stages", each stage with "seconds" and "per_page_ms"
+    """
+    stages: Dict[str, dict] = dict()
+
+    def _time(name: str, func: Callable, setup: Optional[Callable] = None):
+        best = None
+        for _ in range(repeat):
+            args = setup() if setup is not None else ()
+            start = time.perf_counter()
+            func(*args)
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        stages[name] = {
+            "seconds": round(best, 6),
+            "per_page_ms": round(best / pages * 1000, 4),
+        }
+        print(f"{name:24} {best:10.4f} sec {best / pages * 1000:10.4f} ms/page")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source_path = Path(tmp) / "source"
+        filenames = generate_site(source_path, pages=pages, **generate_kwargs)
+        texts = [f.read_text() for f in filenames]
+
+        def _load_pages():
+            return [Page.from_file(f) for f in filenames],
+
+        def _read_front_matter():
+            for filename in filenames:
+                with open(filename) as fp:
+                    read_front_matter(fp)
+
+        _time("front_matter_split", lambda: [split_front_matter_and_markup(t) for t in texts])
+        _time("front_matter_read", _read_front_matter)
+        _time("jinja_render", lambda ps: [p.markup.markup(p.context, p.env) for p in ps], _load_pages)
+
+        rendered = [p.markup.markup(p.context, p.env) for p in _load_pages()[0]]
+        _time("marko_parse", lambda: [Markdown().parse(t) for t in rendered])
+
+        documents = [Markdown().parse(t) for t in rendered]
+        _time("html_render", lambda: [HTMLRenderer().render(d) for d in documents])
+
+        link_mapping = {
+            f"images/{f.name}": f"/assets/{f.name}"
+            for f in (source_path / "images").iterdir()
+        }
+        _time("link_rewrite_md", lambda: [replace_markdown_links(t, link_mapping) for t in rendered])
+        _time("link_rewrite_html", lambda: [LinkReplaceHTMLRenderer(link_mapping).render(d) for d in documents])
+
+        def _site():
+            site = Site()
+            site.add_page(*_load_pages()[0])
+            return site,
+
+        for format in formats:
+            _time(f"build_{format}", lambda site: list(site.iter_files(format)), _site)
+
+            files = list(_site()[0].iter_files(format))
+            output_path = Path(tmp) / f"output-{format}"
+
+            def _write():
+                writer = FileWriter(output_path)
+                for filename, content in files:
+                    writer.write(filename, content)
+
+            _time(f"write_{format}", _write)
+
+    return {
+        "meta": {
+            "pages": pages,
+            "repeat": repeat,
+            "generate": generate_kwargs,
+            "python": platform.python_version(),
+            "jinja2": jinja2.__version__,
+            "marko": marko.__version__,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "stages": stages,
+    }
+
+
+def print_comparison(results: dict, baseline: dict):
+    print(f"\n{'stage':24} {'baseline':>10} {'current':>10} {'ratio':>8}")
+    for name, stage in results["stages"].items():
+        if name in baseline["stages"]:
+            old = baseline["stages"][name]["per_page_ms"]
+            new = stage["per_page_ms"]
+            ratio = new / old if old else float("nan")
+            print(f"{name:24} {old:10.4f} {new:10.4f} {ratio:8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the build stages on a synthetic site")
+    parser.add_argument("-p", "--pages", type=int, default=100)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("-f", "--format", type=str, nargs="+", default=["md", "html"], choices=["md", "html"])
+    parser.add_argument("--paragraphs", type=int, default=10)
+    parser.add_argument("--headings", type=int, default=3)
+    parser.add_argument("--links", type=int, default=5)
+    parser.add_argument("--images", type=int, default=2)
+    parser.add_argument("--css-files", type=int, default=2)
+    parser.add_argument("--no-template", action="store_true")
+    parser.add_argument("-o", "--output", type=str, default=None, help="Store results in this json file")
+    parser.add_argument("-c", "--compare", type=str, default=None, help="Compare with results from this json file")
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        pages=args.pages, repeat=args.repeat, formats=tuple(args.format),
+        paragraphs=args.paragraphs, headings=args.headings, links=args.links,
+        images=args.images, css_files=args.css_files, templated=not args.no_template,
+    )
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+    if args.compare:
+        print_comparison(results, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import os
+import threading
+from pathlib import Path
+from typing import Optional, Union, List, Tuple
+
+from . import stats
+
+
+class RenderCache:
+    """
+    Persistent cache of rendered output, stored as one file per entry.
+
+    Entries are stored under their key, a hex hash of all inputs of the
+    rendered output, in sub-directories of the first two characters of the key.
+    The modification time of an entry is updated when it's read,
+    so ``evict`` removes the least recently used entries.
+
+    The directory can be kept between builds, e.g. restored by a CI job.
+
+    :param path: the cache directory
+    """
+
+    # part of every key, increase when the rendered output changes for the same inputs
+    VERSION = 1
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}('{self.path}')"
+
+    def filename(self, key: str) -> Path:
+        return self.path / key[:2] / key[2:]
+
+    def get(self, key: str) -> Optional[str]:
+        filename = self.filename(key)
+        try:
+            value = filename.read_bytes().decode("utf-8")
+        except FileNotFoundError:
+            stats.count("render_cache_misses")
+            return None
+
+        try:
+            os.utime(filename)
+        except OSError:
+            pass
+        stats.count("render_cache_hits")
+        return value
+
+    def set(self, key: str, value: str):
+        filename = self.filename(key)
+        os.makedirs(filename.parent, exist_ok=True)
+        temp_name = filename.with_name(f".{filename.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+        try:
+            temp_name.write_bytes(value.encode("utf-8"))
+            os.replace(temp_name, filename)
+        except BaseException:
+            if temp_name.exists():
+                temp_name.unlink()
+            raise
+
+    def entries(self) -> List[Tuple[Path, int, int]]:
+        """
+        :return: list of (filename, size, mtime in ns) of all entries
+        """
+        entries = []
+        if not self.path.exists():
+            return entries
+
+        with os.scandir(self.path) as shards:
+            for shard in shards:
+                if not shard.is_dir(follow_symlinks=False):
+                    continue
+                with os.scandir(shard.path) as files:
+                    for file in files:
+                        if file.name.startswith("."):
+                            continue
+                        stat = file.stat(follow_symlinks=False)
+                        entries.append((Path(file.path), stat.st_size, stat.st_mtime_ns))
+        return entries
+
+    def size(self) -> int:
+        return sum(e[1] for e in self.entries())
+
+    def evict(self, max_size: int) -> int:
+        """
+        Remove the least recently used entries until the cache is at most ``max_size`` bytes.
+
+        :return: int, number of removed entries
+        """
+        entries = self.entries()
+        size = sum(e[1] for e in entries)
+        removed = 0
+        for filename, file_size, _ in sorted(entries, key=lambda e: e[2]):
+            if size <= max_size:
+                break
+            try:
+                filename.unlink()
+            except FileNotFoundError:
+                pass
+            size -= file_size
+            removed += 1
+        return removed
+
+    def clear(self):
+        self.evict(0)
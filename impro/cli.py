@@ -1,11 +1,22 @@
 import argparse
+import cProfile
 import json
+import pstats
+import sys
 from pathlib import Path
 from typing import List, Type, Union, Optional
 
+from impro.environment import Environment
+from impro.files import SourceFile, COPY_MODES
+from impro.manifest import BuildManifest
 from impro.pages.page import Page
 from impro.site import Site
+from impro.stats import BuildStats
 from impro.server import run_server
+from impro.watch import watch_and_write
+from impro.writer import (
+    FileWriter, SyncFileWriter, BackgroundWriter, ARCHIVE_FORMATS, archive_format, archive_writer,
+)
 
 
 def parse_args() -> dict:
@@ -18,19 +29,111 @@ def parse_args() -> dict:
     )
     parser.add_argument(
         "input", type=str, nargs="*",
-        help="One or more inputs",
+        help="One or more input files or directories",
     )
     parser.add_argument(
         "-o", "--output", type=str, default="-",
-        help="Output directory, or '-' for stdout",
+        help="Output directory, archive file like 'site.tar.gz' or 'site.zip', or '-' for stdout",
+    )
+    parser.add_argument(
+        "-a", "--archive", type=str, default=None,
+        choices=list(ARCHIVE_FORMATS),
+        help="Write an archive of this format, required to write an archive to stdout",
     )
     parser.add_argument(
         "-f", "--format", type=str, default="md",
         choices=["md", "html"],
         help="Output format",
     )
+    parser.add_argument(
+        "-p", "--path", type=str, default="docs",
+        help="Page path of the input files, sub-directories of input directories are appended",
+    )
+    parser.add_argument(
+        "--include", type=str, action="append", default=None,
+        help="File pattern to include from input directories, can be repeated. Default is '*.md'",
+    )
+    parser.add_argument(
+        "--exclude", type=str, action="append", default=None,
+        help="File or directory pattern to exclude from input directories, can be repeated. Default is '.*'",
+    )
+    parser.add_argument(
+        "--fingerprint", type=str, nargs="?", const="/assets", default=None, metavar="PATH",
+        help="Write associated files under their content hash to PATH, default '/assets'",
+    )
+    parser.add_argument(
+        "--bundle-css", type=str, nargs="?", const="/css", default=None, metavar="PATH",
+        help="Compile and bundle the stylesheets of each html page into one file in PATH, default '/css'",
+    )
+    parser.add_argument(
+        "--minify-css", action="store_true",
+        help="Minify bundled stylesheets, see --bundle-css",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1,
+        help="Number of processes to render pages in parallel",
+    )
+    parser.add_argument(
+        "-i", "--incremental", action="store_true",
+        help="Only render files whose inputs changed since the last render into the output directory",
+    )
+    parser.add_argument(
+        "-s", "--sync", action="store_true",
+        help="Only replace changed files in the output directory and delete files of previous renders that are not part of the site anymore",
+    )
+    parser.add_argument(
+        "-c", "--copy-mode", type=str, default="copy",
+        choices=COPY_MODES,
+        help="How associated files are copied to the output directory",
+    )
+    parser.add_argument(
+        "--write-threads", type=int, default=0,
+        help="Write files in this many background threads while rendering, "
+             "archives are always written by a single thread",
+    )
+    parser.add_argument(
+        "-z", "--gzip", action="store_true",
+        help="Write gzip compressed .gz files next to compressible output files",
+    )
+    parser.add_argument(
+        "--fast", action="store_true",
+        help="site-info: print the page metadata as json, without rendering the pages",
+    )
+    parser.add_argument(
+        "--cache-dir", type=str, default=None,
+        help="Directory for persistent caches of compiled templates and rendered output",
+    )
+    parser.add_argument(
+        "--cache-size", type=int, default=256,
+        help="Maximum size of the rendered output cache in megabytes",
+    )
+    parser.add_argument(
+        "-w", "--watch", action="store_true",
+        help="Render changed pages again when their files or templates change",
+    )
+    parser.add_argument(
+        "--report", type=str, default=None,
+        help="Write per-stage and per-page timings and counters to this json file",
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="Run with cProfile and print the most expensive functions. "
+             "Only the main process is profiled, see --jobs",
+    )
+    parser.add_argument(
+        "--top", type=int, default=10,
+        help="Number of slowest pages in --report",
+    )
+    parser.add_argument(
+        "--host", type=str, default="",
+        help="Host address for the server",
+    )
+    parser.add_argument(
+        "--port", type=int, default=8000,
+        help="Port for the server",
+    )
 
-    return vars(parser.parse_args())
+    return vars(parser.parse_intermixed_args())
 
 
 def main(
@@ -38,10 +141,55 @@ def main(
         input: List[str],
         output: str,
         format: str,
+        jobs: int = 1,
+        incremental: bool = False,
+        sync: bool = False,
+        copy_mode: str = "copy",
+        cache_dir: Optional[str] = None,
+        cache_size: int = 256,
+        host: str = "",
+        port: int = 8000,
+        watch: bool = False,
+        gzip: bool = False,
+        fast: bool = False,
+        report: Optional[str] = None,
+        profile: bool = False,
+        top: int = 10,
+        path: Optional[str] = "docs",
+        include: Optional[List[str]] = None,
+        exclude: Optional[List[str]] = None,
+        fingerprint: Optional[str] = None,
+        bundle_css: Optional[str] = None,
+        minify_css: bool = False,
+        archive: Optional[str] = None,
+        write_threads: int = 0,
 ):
+    if report or profile:
+        kwargs = {**locals(), "report": None, "profile": False}
+        build_stats = BuildStats()
+        profiler = cProfile.Profile() if profile else None
+        try:
+            with build_stats:
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    main(**kwargs)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        finally:
+            if profiler is not None:
+                pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(30)
+            if report:
+                build_stats.save(report, top=top)
+                print(build_stats.summary(top=top), file=sys.stderr)
+        return
+
+    env = Environment(cache_path=cache_dir)
+
     if command == "info":
         for filename in input:
-            page = Page.from_file(filename)
+            page = Page.from_file(Path(filename).absolute(), env=env)
             print(f"--- {page} ---")
             print(f"  format: {page.markup.format}")
             print(f"  title: '{page.title}'")
@@ -57,46 +205,130 @@ def main(
             print("Need to specify at least one input")
             exit(1)
 
-        site = Site()
-        for filename in input:
-            page = Page.from_file(filename)
-            site.add_page(page, path="docs")
+        site = load_site(
+            input, env=env, path=path, include=include, exclude=exclude,
+            fingerprint=fingerprint, bundle_css=bundle_css, minify_css=minify_css,
+        )
 
-        if output == "-":
-            for filename, content in site.iter_files(format=format):
+        if archive is None and output != "-":
+            archive = archive_format(output)
+
+        if archive is not None:
+            if incremental or sync or gzip or watch:
+                print("Can not use --incremental, --sync, --gzip or --watch with archives")
+                exit(1)
+            writer = archive_writer(sys.stdout.buffer if output == "-" else output, format=archive)
+            if write_threads > 0:
+                writer = BackgroundWriter(writer, workers=write_threads)
+            site.write_files(root="/", format=format, workers=jobs, writer=writer)
+
+        elif output == "-":
+            for filename, content in site.iter_files(format=format, workers=jobs):
                 print()
                 print("-"*32, filename, "-"*32)
-                if isinstance(content, bytes):
+                if isinstance(content, (bytes, SourceFile)):
                     print(len(content), "bytes")
                 else:
                     print(content)
 
         else:
             output = Path(output).absolute()
-            site.write_files(root=output, format=format)
+            if sync and contains_sources(output, site, input):
+                print(f"Can not use --sync, output directory '{output}' contains the site's sources")
+                exit(1)
+            manifest = BuildManifest.load(output) if incremental else None
+            writer_class = SyncFileWriter if sync else FileWriter
+            writer = writer_class(root=output, copy_mode=copy_mode)
+            if write_threads > 0:
+                writer = BackgroundWriter(writer, workers=write_threads)
+            writer = site.write_files(
+                root=output, format=format, workers=jobs, manifest=manifest,
+                writer=writer, compress=gzip,
+            )
+            if manifest is not None:
+                print(manifest)
+
+            if watch:
+                watch_and_write(site, format, writer)
 
     elif command == "site-info":
-        site = Site()
-        for filename in input:
-            page = Page.from_file(filename)
-            site.add_page(page, path="docs")
+        site = load_site(
+            input, env=env, path=path, include=include, exclude=exclude,
+            fingerprint=fingerprint, bundle_css=bundle_css, minify_css=minify_css,
+        )
 
-        print(f"--- {site} ---")
-        print("  files:")
-        for filename, content in site.iter_files(format):
-            print(f'    {len(content):9d} {filename}')
+        if fast:
+            print(json.dumps(site.index(format), indent=2, default=str))
+        else:
+            print(f"--- {site} ---")
+            print("  files:")
+            for filename, content in site.iter_files(format, workers=jobs):
+                print(f'    {len(content):9d} {filename}')
 
     elif command == "serve":
-        site = Site()
-        for filename in input:
-            page = Page.from_file(filename)
-            site.add_page(page, path="docs")
+        site = load_site(
+            input, env=env, path=path, include=include, exclude=exclude,
+            fingerprint=fingerprint, bundle_css=bundle_css, minify_css=minify_css,
+        )
 
-        run_server(site)
+        run_server(site, host=host, port=port, watch=watch)
 
     else:
         raise ValueError(f"Unknown command '{command}'")
 
+    if env.render_cache() is not None:
+        env.render_cache().evict(cache_size * 1024 * 1024)
+
+
+def load_site(
+        input: List[str],
+        env: Environment,
+        path: Optional[str] = "docs",
+        include: Optional[List[str]] = None,
+        exclude: Optional[List[str]] = None,
+        fingerprint: Optional[str] = None,
+        bundle_css: Optional[str] = None,
+        minify_css: bool = False,
+) -> Site:
+    """
+    Create a Site from input files and directories, see ``Site.add_directory``
+    """
+    site = Site(
+        fingerprint_path=fingerprint,
+        css_bundle_path=bundle_css,
+        minify_css=minify_css,
+        style_cache_path=env.cache_path / "styles" if env.cache_path is not None else None,
+    )
+    for filename in input:
+        filename = Path(filename).absolute()
+        if filename.is_dir():
+            site.add_directory(
+                filename, env=env, path=path,
+                include=include or ("*.md",),
+                exclude=exclude or (".*",),
+            )
+        else:
+            site.add_page(Page.from_file(filename, env=env), path=path)
+    return site
+
+
+def contains_sources(output: Path, site: Site, input: List[str]) -> bool:
+    """
+    Check if the directory ``output`` is or contains one of the inputs or page files
+    """
+    output = output.resolve()
+    sources = [Path(filename).absolute() for filename in input]
+    sources.extend(
+        site.get_page(key).markup.filename
+        for key in site.page_keys()
+        if site.get_page(key).markup.filename
+    )
+    for source in sources:
+        source = Path(source).resolve()
+        if source == output or output in source.parents:
+            return True
+    return False
+
 
 if __name__ == "__main__":
     main(**parse_args())
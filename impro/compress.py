@@ -0,0 +1,109 @@
+import gzip
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, List, Optional, Union
+
+
+COMPRESSIBLE_EXTENSIONS = (
+    ".css", ".html", ".js", ".json", ".md", ".svg", ".txt", ".xml",
+)
+
+# files smaller than this are not worth the extra request header and file
+GZIP_MIN_SIZE = 1024
+
+
+def is_compressible(filename: Union[str, Path]) -> bool:
+    return str(filename).lower().endswith(COMPRESSIBLE_EXTENSIONS)
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """
+    Check if an Accept-Encoding header value allows gzip.
+
+    An explicit q-value for gzip, e.g. "gzip;q=0", overrides the one of "*".
+    """
+    if not accept_encoding:
+        return False
+
+    # coding -> q-value
+    qvalues = dict()
+    for coding in accept_encoding.split(","):
+        name, *params = coding.split(";")
+        name = name.strip().lower()
+        if name == "x-gzip":
+            name = "gzip"
+        if not name:
+            continue
+
+        qvalue = 1.
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    qvalue = float(value.strip())
+                except ValueError:
+                    qvalue = 0.
+        qvalues[name] = qvalue
+
+    return qvalues.get("gzip", qvalues.get("*", 0.)) > 0
+
+
+def gzip_bytes(content: bytes, level: int = 9) -> bytes:
+    # mtime=0 makes the output only depend on the content
+    return gzip.compress(content, compresslevel=level, mtime=0)
+
+
+def compress_files(
+        files: Iterable[Union[str, Path]],
+        min_size: int = GZIP_MIN_SIZE,
+        workers: Optional[int] = None,
+        level: int = 9,
+) -> List[Path]:
+    """
+    Write a ``.gz`` sibling for every compressible file of at least ``min_size`` bytes.
+
+    The ``.gz`` files get the modification time of their source
+    and are only written again when the source's modification time changed.
+
+    :param files: iterable of filenames
+    :param min_size: int, minimum file size
+    :param workers: optional int, number of threads, zlib releases the GIL while compressing
+    :param level: int, gzip compression level
+    :return: list of all ``.gz`` filenames, including the unchanged ones
+    """
+    files = [Path(f) for f in files if is_compressible(f)]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        gz_files = executor.map(lambda f: _compress_file(f, min_size, level), files)
+        return [f for f in gz_files if f is not None]
+
+
+def _compress_file(filename: Path, min_size: int, level: int) -> Optional[Path]:
+    stat = filename.stat()
+    if stat.st_size < min_size:
+        return None
+
+    gz_filename = filename.with_name(filename.name + ".gz")
+    try:
+        if gz_filename.stat().st_mtime_ns == stat.st_mtime_ns:
+            return gz_filename
+    except FileNotFoundError:
+        pass
+
+    temp_name = gz_filename.with_name(f".{gz_filename.name}.{os.getpid()}.tmp")
+    try:
+        with open(filename, "rb") as fsrc, gzip.GzipFile(temp_name, "wb", compresslevel=level, mtime=0) as fdst:
+            while True:
+                chunk = fsrc.read(1 << 20)
+                if not chunk:
+                    break
+                fdst.write(chunk)
+        os.utime(temp_name, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(temp_name, gz_filename)
+    except BaseException:
+        if temp_name.exists():
+            temp_name.unlink()
+        raise
+
+    return gz_filename
@@ -1,12 +1,35 @@
 import os
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Tuple, Union, Optional, Iterable
+from typing import List, Tuple, Union, Optional, Iterable, Dict, Set, FrozenSet
 
 from jinja2 import Environment as JinjaEnvironment
-from jinja2 import Template, FileSystemLoader
+from jinja2 import Template, FileSystemLoader, FileSystemBytecodeCache
+
+from .cache import RenderCache
+from . import stats
+
+
+# jinja environments shared by all Environments with the same search paths and cache path,
+# the least recently used are dropped, Environments that use them keep them
+_jinja_environments: "OrderedDict[tuple, JinjaEnvironment]" = OrderedDict()
+_jinja_lock = threading.Lock()
+
+# number of jinja environments kept in ``_jinja_environments``
+MAX_JINJA_ENVIRONMENTS = 16
 
 
 class Environment:
+    """
+    Template search paths and settings for rendering pages.
+
+    :param search_paths: optional list of directories to search for templates,
+        the impro templates directory is always appended
+    :param html_default_layout: str, the default layout template for html output
+    :param cache_path: optional directory for persistent caches,
+        compiled jinja templates and rendered output, see ``render_cache``
+    """
 
     IMPRO_PATH: Path = Path(__file__).parent
 
@@ -14,8 +37,10 @@ class Environment:
             self,
             search_paths: Optional[Iterable[Union[str, Path]]] = None,
             html_default_layout: str = "base.html",
+            cache_path: Optional[Union[str, Path]] = None,
     ):
         self.html_default_layout = html_default_layout
+        self.cache_path: Optional[Path] = Path(cache_path) if cache_path is not None else None
 
         self._search_paths: List[Path] = []
         if search_paths is not None:
@@ -23,12 +48,30 @@ class Environment:
         self._search_paths.append(self.IMPRO_PATH / "templates")
 
         self._jinja_env: Optional[JinjaEnvironment] = None
+        # (search paths, relative filename) -> found filename or None, see ``find_file``
+        self._found_files: Dict[Tuple[Tuple[Path, ...], Path], Optional[Path]] = dict()
+        # directory -> names of it's entries, or None if it's not a readable directory
+        self._directory_entries: Dict[Path, Optional[FrozenSet[str]]] = dict()
 
     def __copy__(self):
-        e = Environment()
+        e = Environment(
+            html_default_layout=self.html_default_layout,
+            cache_path=self.cache_path,
+        )
         e._search_paths = self._search_paths.copy()
+        # copies share the file cache, e.g. the environments of all pages of a site
+        e._found_files = self._found_files
+        e._directory_entries = self._directory_entries
         return e
 
+    def __getstate__(self):
+        # the jinja environment is re-created on demand, e.g. in a worker process
+        state = self.__dict__.copy()
+        state["_jinja_env"] = None
+        state["_found_files"] = dict()
+        state["_directory_entries"] = dict()
+        return state
+
     def copy(self) -> "Environment":
         return self.__copy__()
 
@@ -51,19 +94,147 @@ class Environment:
         self._jinja_env = None
 
     def find_file(self, file: Union[str, Path]) -> Optional[Path]:
+        """
+        Return the first search path joined with the relative ``file`` that exists.
+
+        Results of relative files are cached by this Environment and it's copies
+        and the search paths' directory listings are read once, so files that
+        are created or deleted afterwards are only noticed after ``clear_file_cache``.
+        """
         file = Path(file)
         if file.is_absolute():
             return file if file.exists() else None
 
-        for p in self.search_paths:
-            pf = p / file
-            if pf.exists():
-                return pf
+        key = (tuple(self._search_paths), file)
+        if key in self._found_files:
+            stats.count("find_file_cache_hits")
+            return self._found_files[key]
+
+        found = None
+        for p in self._search_paths:
+            if self._path_exists(p, file):
+                found = p / file
+                break
+
+        self._found_files[key] = found
+        return found
+
+    def clear_file_cache(self):
+        """
+        Forget all results of ``find_file`` and all directory listings,
+        of this Environment and it's copies
+        """
+        self._found_files.clear()
+        self._directory_entries.clear()
+
+    def render_cache(self) -> Optional[RenderCache]:
+        """
+        The cache of rendered output in ``cache_path``, or None
+        """
+        if self.cache_path is None:
+            return None
+        return RenderCache(self.cache_path / "render")
+
+    def template_dependencies(self, source: str) -> List[Path]:
+        """
+        Return the files of all templates that are extended, included or imported
+        by the template ``source``, recursively.
+
+        Template names that can not be resolved statically are ignored.
+        """
+        return self._walk_templates(source)[0]
+
+    def template_variables(self, source: str) -> Optional[Set[str]]:
+        """
+        Return the names of all context variables that the template ``source``
+        and the templates it extends, includes or imports refer to.
+
+        :return: set of str, or None if a template name can not be resolved statically
+        """
+        return self._walk_templates(source)[1]
+
+    def _walk_templates(self, source: str) -> Tuple[List[Path], Optional[Set[str]]]:
+        from jinja2 import meta
+
+        dependencies = []
+        variables = set()
+        handled_names = set()
+        todo = [source]
+        while todo:
+            source = todo.pop()
+            if "{%" not in source and "{{" not in source:
+                continue
+
+            ast = self.jinja_env().parse(source)
+            if variables is not None:
+                variables.update(meta.find_undeclared_variables(ast))
+
+            for name in meta.find_referenced_templates(ast):
+                if name is None:
+                    variables = None
+                    continue
+                if name in handled_names:
+                    continue
+                handled_names.add(name)
+
+                filename = self.find_file(name)
+                if filename is not None:
+                    dependencies.append(filename)
+                    todo.append(filename.read_text())
+
+        return dependencies, variables
 
     def jinja_env(self) -> JinjaEnvironment:
+        """
+        The jinja environment for the current search paths.
+
+        It is shared with all other Environments that have the same search paths
+        and cache path, so templates loaded by name are only compiled once.
+        The last ``MAX_JINJA_ENVIRONMENTS`` different jinja environments are shared.
+        """
         if self._jinja_env is None:
-            self._jinja_env = JinjaEnvironment(
-                loader=FileSystemLoader(searchpath=self._search_paths)
-            )
+            key = (tuple(str(p) for p in self._search_paths), str(self.cache_path))
+            with _jinja_lock:
+                jinja_env = _jinja_environments.get(key)
+                if jinja_env is not None:
+                    _jinja_environments.move_to_end(key)
+            if jinja_env is None:
+                bytecode_cache = None
+                if self.cache_path is not None:
+                    bytecode_path = self.cache_path / "jinja"
+                    os.makedirs(bytecode_path, exist_ok=True)
+                    bytecode_cache = FileSystemBytecodeCache(str(bytecode_path))
+
+                jinja_env = JinjaEnvironment(
+                    loader=FileSystemLoader(searchpath=self._search_paths),
+                    bytecode_cache=bytecode_cache,
+                )
+                with _jinja_lock:
+                    jinja_env = _jinja_environments.setdefault(key, jinja_env)
+                    while len(_jinja_environments) > MAX_JINJA_ENVIRONMENTS:
+                        _jinja_environments.popitem(last=False)
+            self._jinja_env = jinja_env
         return self._jinja_env
 
+    def _path_exists(self, root: Path, file: Path) -> bool:
+        """
+        Check if ``root / file`` exists, using the cached directory listings
+        """
+        if any(part in (".", "..") for part in file.parts):
+            return (root / file).exists()
+
+        directory = root
+        for part in file.parts:
+            entries = self._directory_entries.get(directory, False)
+            if entries is False:
+                try:
+                    entries = frozenset(os.listdir(directory))
+                except OSError:
+                    entries = None
+                self._directory_entries[directory] = entries
+
+            if entries is None or part not in entries:
+                return False
+            directory = directory / part
+
+        return True
@@ -2,3 +2,17 @@
 
 class FrontMatterError(Exception):
     pass
+
+
+class WriteError(Exception):
+    """
+    Raised when writing one or more files failed.
+
+    ``errors`` is the list of (filename, exception).
+    """
+    def __init__(self, errors: list):
+        self.errors = errors
+        filename, error = errors[0]
+        super().__init__(
+            f"Writing {len(errors)} file(s) failed, first error for '{filename}': {type(error).__name__}: {error}"
+        )
@@ -0,0 +1,174 @@
+import fnmatch
+import os
+from pathlib import Path
+from typing import Union, BinaryIO, Iterable, List, Tuple
+
+
+COPY_MODES = ("copy", "hardlink", "reflink")
+
+# linux ioctl request to share the data blocks of two files on copy-on-write filesystems
+FICLONE = 0x40049409
+
+
+class SourceFile:
+    """
+    Reference to a file on disk.
+
+    Used as file content to let writers copy the file
+    instead of loading it into memory.
+    """
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}('{self.path}')"
+
+    def __eq__(self, other):
+        return isinstance(other, SourceFile) and self.path == other.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def size(self) -> int:
+        return self.path.stat().st_size
+
+    def open(self) -> BinaryIO:
+        return open(self.path, "rb")
+
+    def read(self) -> bytes:
+        return self.path.read_bytes()
+
+
+def find_files(
+        root: Union[str, Path],
+        include: Iterable[str] = ("*.md",),
+        exclude: Iterable[str] = (".*",),
+) -> List[Tuple[str, Path]]:
+    """
+    Recursively find files below ``root``.
+
+    Patterns are ``fnmatch`` patterns. Patterns without a ``/`` are matched
+    against the file or directory name, others against the path relative to ``root``,
+    where ``*`` also matches ``/``.
+    Excluded directories are not entered.
+
+    :param root: the directory to search
+    :param include: file patterns to include
+    :param exclude: file and directory patterns to exclude
+    :return: list of (relative directory, filename), sorted by relative path.
+        The relative directory is "" for files directly in ``root``,
+        otherwise like "sub/dir".
+    """
+    include = list(include)
+    exclude = list(exclude)
+
+    def _matches(patterns: List[str], name: str, rel_path: str) -> bool:
+        for pattern in patterns:
+            if fnmatch.fnmatchcase(rel_path if "/" in pattern else name, pattern):
+                return True
+        return False
+
+    files = []
+    todo = [("", Path(root))]
+    while todo:
+        rel_dir, path = todo.pop()
+        with os.scandir(path) as entries:
+            for entry in entries:
+                rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                if _matches(exclude, entry.name, rel_path):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    todo.append((rel_path, Path(entry.path)))
+                elif entry.is_file() and _matches(include, entry.name, rel_path):
+                    files.append((rel_dir, Path(entry.path)))
+
+    files.sort(key=lambda f: (f[0].split("/") if f[0] else [], f[1].name))
+    return files
+
+
+def copy_file(source: Union[str, Path], destination: Union[str, Path], mode: str = "copy"):
+    """
+    Copy a file without passing the data through python.
+
+    :param source: source filename
+    :param destination: destination filename, will be replaced if existing
+    :param mode: str, one of
+        - "copy": copy with os.copy_file_range or os.sendfile where available
+        - "hardlink": link the destination to the source, falls back to "copy"
+          if not possible, e.g. across filesystems
+        - "reflink": clone the data blocks on copy-on-write filesystems,
+          falls back to "copy" if not supported
+    """
+    if mode not in COPY_MODES:
+        raise ValueError(f"Invalid copy mode '{mode}', expected one of {COPY_MODES}")
+
+    # never write into an existing file, it may be a hardlink to the source
+    if os.path.lexists(destination):
+        os.unlink(destination)
+
+    if mode == "hardlink":
+        try:
+            os.link(source, destination)
+            return
+        except OSError:
+            pass
+
+    with open(source, "rb") as fsrc, open(destination, "wb") as fdst:
+        if mode == "reflink" and _reflink(fsrc.fileno(), fdst.fileno()):
+            return
+        _copy_fd(fsrc.fileno(), fdst.fileno(), os.fstat(fsrc.fileno()).st_size)
+
+
+def _reflink(src_fd: int, dst_fd: int) -> bool:
+    try:
+        import fcntl
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        return True
+    except (ImportError, OSError):
+        return False
+
+
+def _copy_fd(src_fd: int, dst_fd: int, size: int):
+    copy_functions = []
+    if hasattr(os, "copy_file_range"):
+        copy_functions.append(_copy_file_range)
+    if hasattr(os, "sendfile"):
+        copy_functions.append(_sendfile)
+
+    for func in copy_functions:
+        try:
+            func(src_fd, dst_fd, size)
+            return
+        except OSError:
+            os.lseek(dst_fd, 0, os.SEEK_SET)
+            os.ftruncate(dst_fd, 0)
+
+    os.lseek(src_fd, 0, os.SEEK_SET)
+    while True:
+        chunk = os.read(src_fd, 1 << 20)
+        if not chunk:
+            break
+        while chunk:
+            chunk = chunk[os.write(dst_fd, chunk):]
+
+
+def _copy_file_range(src_fd: int, dst_fd: int, size: int):
+    offset = 0
+    while offset < size:
+        copied = os.copy_file_range(src_fd, dst_fd, size - offset, offset, offset)
+        if not copied:
+            break
+        offset += copied
+
+
+def _sendfile(src_fd: int, dst_fd: int, size: int):
+    offset = 0
+    while offset < size:
+        sent = os.sendfile(dst_fd, src_fd, offset, size - offset)
+        if not sent:
+            break
+        offset += sent
@@ -0,0 +1,140 @@
+import json
+from pathlib import Path
+from typing import List, Dict, Union, Optional, Iterable
+
+from .util import hash_file
+
+
+class BuildManifest:
+    """
+    Records the input hashes of every output file of a build
+    so that the next build into the same directory can skip unchanged files.
+
+    Each entry is stored under the output filename and contains:
+
+        - "inputs": hash of the page source, front-matter, context and templates,
+          or the content hash of an associated file
+        - "sources": dict of associated source file -> content hash
+        - "assets": list of output filenames of the associated files of a page
+    """
+
+    FILENAME = ".impro-manifest.json"
+    VERSION = 1
+
+    def __init__(self, root: Union[str, Path]):
+        self.root = Path(root)
+        self.entries: Dict[str, dict] = dict()
+        self.new_entries: Dict[str, dict] = dict()
+        self.rebuilt: List[str] = []
+        self.skipped: List[str] = []
+        self.deleted: List[str] = []
+        self._file_hashes: Dict[str, str] = dict()
+
+    def __str__(self):
+        return (
+            f"{self.__class__.__name__}(rebuilt={len(self.rebuilt)}"
+            f", skipped={len(self.skipped)}, deleted={len(self.deleted)})"
+        )
+
+    @property
+    def filename(self) -> Path:
+        return self.root / self.FILENAME
+
+    @classmethod
+    def load(cls, root: Union[str, Path]) -> "BuildManifest":
+        """
+        Load the manifest of a previous build in ``root``.
+
+        A missing or incompatible manifest results in an empty one.
+        """
+        manifest = cls(root)
+        try:
+            data = json.loads(manifest.filename.read_text())
+        except (IOError, ValueError):
+            return manifest
+
+        if isinstance(data, dict) and data.get("version") == cls.VERSION:
+            manifest.entries = data["files"]
+        return manifest
+
+    def save(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.filename.write_text(json.dumps(
+            {"version": self.VERSION, "files": self.new_entries},
+            indent=1,
+        ))
+
+    def file_hash(self, filename: Union[str, Path]) -> str:
+        filename = str(filename)
+        if filename not in self._file_hashes:
+            self._file_hashes[filename] = hash_file(filename)
+        return self._file_hashes[filename]
+
+    def is_unchanged(self, filename: str, inputs: str) -> bool:
+        """
+        Check if output ``filename`` was previously built from the same inputs
+        and the associated source files did not change.
+        """
+        entry = self.entries.get(filename)
+        if not entry or entry["inputs"] != inputs:
+            return False
+
+        for source, source_hash in entry["sources"].items():
+            try:
+                if self.file_hash(source) != source_hash:
+                    return False
+            except IOError:
+                return False
+
+        for output in [filename] + entry.get("assets", []):
+            if not (self.root / output.lstrip("/")).exists():
+                return False
+
+        return True
+
+    def skip(self, filename: str):
+        """
+        Keep the previous entry of ``filename`` and it's assets
+        """
+        entry = self.entries[filename]
+        self.new_entries[filename] = entry
+        self.skipped.append(filename)
+
+        for asset in entry.get("assets", []):
+            if asset in self.entries and asset not in self.new_entries:
+                self.new_entries[asset] = self.entries[asset]
+                self.skipped.append(asset)
+
+    def add(
+            self,
+            filename: str,
+            inputs: str,
+            sources: Optional[Iterable[Union[str, Path]]] = None,
+            assets: Optional[List[str]] = None,
+    ):
+        """
+        Record a rebuilt output file
+        """
+        entry = {
+            "inputs": inputs,
+            "sources": {
+                str(source): self.file_hash(source)
+                for source in sources or []
+            },
+        }
+        if assets:
+            entry["assets"] = assets
+
+        self.new_entries[filename] = entry
+        self.rebuilt.append(filename)
+
+    def stale_files(self) -> List[str]:
+        """
+        Output files of the previous build that have not been produced
+        or kept by the current build.
+        """
+        return [
+            filename
+            for filename in self.entries
+            if filename not in self.new_entries
+        ]
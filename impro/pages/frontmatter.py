@@ -1,4 +1,4 @@
-from typing import Tuple, Optional
+from typing import Tuple, Optional, List, TextIO
 from yaml import safe_load
 from yaml.scanner import ScannerError
 
@@ -19,15 +19,64 @@ def split_front_matter_and_markup(markup: str) -> Tuple[Optional[dict], str]:
     if markup_lines[0].strip() != "---":
         return None, "\n".join(markup_lines) + "\n"
 
+    try:
+        end = markup_lines.index("---", 1)
+    except ValueError:
+        return None, "\n".join(markup_lines) + "\n"
+
+    front_matter = _parse_front_matter(markup_lines[1:end])
+
+    return front_matter, "\n".join(markup_lines[end + 1:]) + "\n"
+
+
+def read_front_matter(fp: TextIO) -> Tuple[Optional[dict], int]:
+    """
+    Read only the front-matter from a text stream.
+
+    The stream is read up to the closing ``---`` line, the same way
+    as ``split_front_matter_and_markup`` would split the whole text.
+
+    :return: tuple of (dict|None, int), the front-matter and the number of lines,
+        counted from the first non-empty line, that belong to it.
+        See ``strip_front_matter_lines``.
+    """
+    line = fp.readline()
+    while line and not line.strip():
+        line = fp.readline()
+
+    if line.strip() != "---":
+        return None, 0
+
     fm_lines = []
-    markup_lines.pop(0)
-    while markup_lines and markup_lines[0] != "---":
-        fm_lines.append(markup_lines.pop(0))
+    while True:
+        line = fp.readline()
+        if not line:
+            return None, 0
+        line = line.rstrip("\r\n")
+        if line == "---":
+            break
+        fm_lines.append(line)
+
+    num_lines = len(fm_lines) + 2
+    if num_lines < 4:
+        # a text of less than 4 lines (without trailing whitespace) has no front-matter
+        for i, line in enumerate(fp):
+            if i >= 3 - num_lines and line.strip():
+                break
+        else:
+            return None, 0
+
+    return _parse_front_matter(fm_lines), num_lines
+
+
+def strip_front_matter_lines(markup: str, num_lines: int) -> str:
+    """
+    Return the markup without the front-matter, as returned by ``read_front_matter``
+    """
+    return "\n".join(markup.strip().splitlines()[num_lines:]) + "\n"
 
-    if not markup_lines:
-        return None, "\n".join(markup_lines) + "\n"
 
-    returned_markup = "\n".join(markup_lines[1:]) + "\n"
+def _parse_front_matter(fm_lines: List[str]) -> dict:
     front_matter = "\n".join(fm_lines) + "\n"
 
     try:
@@ -38,4 +87,4 @@ def split_front_matter_and_markup(markup: str) -> Tuple[Optional[dict], str]:
     if isinstance(front_matter, str):
         raise FrontMatterError("Parsing front-matter failed")
 
-    return front_matter, returned_markup
+    return front_matter
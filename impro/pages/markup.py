@@ -1,26 +1,56 @@
+import json
 import os
+import threading
 from io import StringIO
 from pathlib import Path
 import warnings
-from typing import List, Tuple, Union, Optional, TextIO, Type, Dict
+from collections import OrderedDict
+from typing import List, Tuple, Union, Optional, TextIO, Type, Dict, Set
 
-from .frontmatter import split_front_matter_and_markup
+from .frontmatter import split_front_matter_and_markup, read_front_matter, strip_front_matter_lines
 from .formats import get_filename_format
 from ..environment import Environment
-from .md import replace_markdown_element_links
+from ..util import hash_data
+from .. import stats
+
+
+# Markups of layout files by (resolved filename, format) -> (mtime, Markup)
+_layout_cache: Dict[Tuple[Path, str], Tuple[int, "Markup"]] = dict()
+
+# number of rendered markups and parsed documents kept per Markup, see ``Markup.markup``
+MAX_CACHED_RENDERS = 8
+
+# guards the rendered markups and parsed documents of all Markups,
+# layouts are shared between pages that render in different threads
+_cache_lock = threading.Lock()
 
 
 class Markup:
 
     def __init__(
             self,
-            markup: str,
+            markup: Optional[str],
             format: str,
             front_matter: Optional[dict] = None,
             filename: Optional[Union[str, Path]] = None,
+            front_matter_lines: int = 0,
     ):
-        self.markup_template = markup
-        self._markup: Optional[str] = None
+        """
+        :param markup: str, the markup template without front-matter.
+            If None, it is read from ``filename`` when first needed
+            and the first ``front_matter_lines`` are skipped.
+        """
+        if markup is None and filename is None:
+            raise ValueError("Need 'filename' when 'markup' is None")
+
+        self._markup_template = markup
+        self._front_matter_lines = front_matter_lines
+        # render key -> rendered markup / parsed document
+        self._rendered: "OrderedDict[str, str]" = OrderedDict()
+        self._documents: OrderedDict = OrderedDict()
+        self._templates = dict()
+        # jinja environment -> referenced context variables
+        self._variables = dict()
         self.format = format
         self.front_matter = front_matter
         self.filename: Optional[Path] = Path(filename) if filename is not None else None
@@ -28,6 +58,24 @@ class Markup:
     def __str__(self):
         return f"Markup({self.filename}, {self.format})"
 
+    @property
+    def markup_template(self) -> str:
+        if self._markup_template is None:
+            with stats.stage("read"):
+                text = self.filename.read_text()
+                self._markup_template = strip_front_matter_lines(text, self._front_matter_lines)
+            if stats.active():
+                stats.count("bytes_read", len(text.encode("utf-8")))
+        return self._markup_template
+
+    def __getstate__(self):
+        # the parsed documents are cheaper to re-create than to pickle
+        state = self.__dict__.copy()
+        state["_documents"] = OrderedDict()
+        state["_templates"] = dict()
+        state["_variables"] = dict()
+        return state
+
     @classmethod
     def from_markdown(
             cls,
@@ -53,12 +101,23 @@ class Markup:
             format: Optional[str] = None,
             env: Optional[Environment] = None,
     ) -> "Markup":
+        """
+        Read a Markup from a file or stream.
+
+        For files, only the front-matter is read,
+        the markup is read when first needed.
+        """
         # read from stream
         if hasattr(file, "read"):
             if not format:
                 raise ValueError(f"Need to specify 'format' when 'file' is a stream")
-            text = file.read()
-            filename = None
+            fm, markup = split_front_matter_and_markup(file.read())
+
+            return cls(
+                markup=markup,
+                format=format,
+                front_matter=fm,
+            )
 
         # read from file
         else:
@@ -74,16 +133,53 @@ class Markup:
                 if not filename:
                     raise IOError(f"Can not find '{file}'")
 
-            text = filename.read_text()
+            with open(filename) as fp:
+                fm, fm_lines = read_front_matter(fp)
 
-        fm, markup = split_front_matter_and_markup(text)
+            return cls(
+                markup=None,
+                format=format,
+                front_matter=fm,
+                filename=filename,
+                front_matter_lines=fm_lines,
+            )
 
-        return cls(
-            markup=markup,
-            format=format,
-            front_matter=fm,
-            filename=filename,
-        )
+    @classmethod
+    def from_layout(
+            cls,
+            file: Union[str, Path],
+            format: str,
+            env: Environment,
+    ) -> "Markup":
+        """
+        Return the Markup of a layout file.
+
+        The Markup, including it's compiled templates, is shared by all callers
+        as long as the file is not modified. Use ``render`` to render it
+        with different contexts.
+        """
+        filename = env.find_file(file)
+        if not filename:
+            raise IOError(f"Can not find '{file}'")
+
+        filename = filename.resolve()
+        mtime = filename.stat().st_mtime_ns
+        key = (filename, format)
+        entry = _layout_cache.get(key)
+        if entry is None or entry[0] != mtime:
+            entry = _layout_cache[key] = (mtime, cls.from_file(filename, format=format))
+        else:
+            stats.count("layout_cache_hits")
+
+        return entry[1]
+
+    def clear_cache(self):
+        """
+        Drop the rendered markups and parsed documents
+        """
+        with _cache_lock:
+            self._rendered.clear()
+            self._documents.clear()
 
     def get_front_matter_value(self, key: str, default=None, type_check: Optional[Type] = None):
         """
@@ -114,16 +210,133 @@ class Markup:
             context: Optional[dict] = None,
             env: Optional[Environment] = None,
     ) -> str:
-        if self._markup is None:
-            if "{%" not in self.markup_template and "{{" not in self.markup_template:
-                self._markup = self.markup_template
-            else:
-                self._render_template(context=context, env=env)
+        """
+        Render the markup template with the context.
+
+        The result is kept for the last ``MAX_CACHED_RENDERS`` different contexts,
+        see ``render_key``. Use ``render`` to render without storing the result.
+        """
+        key = self.render_key(context, env)
+        markup = _lookup(self._rendered, key)
+        if markup is not None:
+            stats.count("markup_cache_hits")
+            return markup
+
+        cache = env.render_cache() if env is not None and self.is_template() else None
+        if cache is not None:
+            cache_key = self.cache_key(context, env, "markup")
+            markup = cache.get(cache_key)
+
+        if markup is None:
+            markup = self.render(context=context, env=env)
+            if cache is not None:
+                cache.set(cache_key, markup)
+
+        _store(self._rendered, key, markup)
+        return markup
+
+    def render_key(self, context: Optional[dict] = None, env: Optional[Environment] = None) -> str:
+        """
+        Return a key that identifies the output of ``render``.
+
+        Only the context variables that the template and the templates it extends,
+        includes or imports refer to are part of the key.
+        """
+        if not self.is_template():
+            return ""
+
+        if env is None:
+            env = Environment()
+
+        variables = self.template_variables(env)
+        context = context or dict()
+        if variables is not None:
+            context = {name: context[name] for name in sorted(variables) if name in context}
+
+        return hash_data([str(p) for p in env.search_paths], context)
 
-            if not self._markup.endswith("\n"):
-                self._markup += "\n"
+    def template_variables(self, env: Environment) -> Optional[Set[str]]:
+        """
+        The context variables the markup refers to, see ``Environment.template_variables``
+        """
+        jinja_env = env.jinja_env()
+        if jinja_env not in self._variables:
+            self._variables[jinja_env] = env.template_variables(self.markup_template)
+        return self._variables[jinja_env]
+
+    def is_template(self) -> bool:
+        """
+        True if the markup contains jinja statements or expressions
+        """
+        return "{%" in self.markup_template or "{{" in self.markup_template
+
+    def cache_key(self, context: Optional[dict], env: Environment, *data) -> str:
+        """
+        Return a key for the ``RenderCache`` that changes with the markup,
+        the context, the referenced template files and the library versions.
+
+        :param data: additional data that the cached value depends on
+        """
+        import jinja2
+        import marko
+        from ..cache import RenderCache
+
+        key_data = [
+            RenderCache.VERSION,
+            jinja2.__version__,
+            marko.__version__,
+            self.format,
+            self.markup_template,
+            context,
+        ]
+        if "{%" in self.markup_template:
+            for filename in env.template_dependencies(self.markup_template):
+                key_data.extend([str(filename), filename.read_bytes()])
+
+        return hash_data(*key_data, *data)
 
-        return self._markup
+    def render(
+            self,
+            context: Optional[dict] = None,
+            env: Optional[Environment] = None,
+    ) -> str:
+        """
+        Render the markup template with the context.
+
+        Unlike ``markup`` the result is not stored.
+        """
+        if not self.is_template():
+            markup = self.markup_template
+        else:
+            template = self.template(env)
+            with stats.stage("jinja_render"):
+                markup = template.render(**(context or dict()))
+
+        if not markup.endswith("\n"):
+            markup += "\n"
+
+        return markup
+
+    def template(self, env: Optional[Environment] = None):
+        """
+        Return the compiled jinja template of the markup.
+
+        Templates are compiled once per jinja environment of ``env``.
+        """
+        if env is None:
+            env = Environment()
+
+        jinja_env = env.jinja_env()
+        template = self._templates.get(jinja_env)
+        if template is None:
+            with stats.stage("jinja_compile"):
+                template = self._templates[jinja_env] = jinja_env.from_string(
+                    source=self.markup_template,
+                )
+            stats.count("template_compilations")
+        else:
+            stats.count("template_cache_hits")
+        return template
 
     def to_html(
             self,
@@ -137,33 +350,71 @@ class Markup:
             return self.markup(context=context, env=env)
 
         elif self.format == "md":
-            from marko import Markdown
-            from marko.html_renderer import HTMLRenderer
-            md = Markdown()
-            doc = md.parse(self.markup(context=context, env=env))
-            if link_mapping:
-                replace_markdown_element_links(doc, link_mapping)
-                #return LinkReplaceHTMLRenderer(link_mapping).render(doc)
-            #else:
-            return HTMLRenderer().render(doc)
+            from .md import HTMLRenderer, LinkReplaceHTMLRenderer
+            cache = env.render_cache() if env is not None else None
+            if cache is not None:
+                key = self.cache_key(context, env, "html", link_mapping)
+                html = cache.get(key)
+                if html is not None:
+                    return html
+
+            doc = self.document(context=context, env=env)
+            with stats.stage("html_render"):
+                if link_mapping:
+                    html = LinkReplaceHTMLRenderer(link_mapping).render(doc)
+                else:
+                    html = HTMLRenderer().render(doc)
+
+            if cache is not None:
+                cache.set(key, html)
+            return html
 
         else:
             raise NotImplementedError(self.format)
 
-    def get_elements(self, context: Optional[dict] = None, env: Optional[Environment] = None) -> dict:
-        from .md import Markdown, get_markdown_elements
+    def document(self, context: Optional[dict] = None, env: Optional[Environment] = None):
+        """
+        Return the parsed markdown document.
+
+        The document is parsed once per context, see ``markup``, and shared between
+        element extraction and html rendering. It must not be modified by the caller.
+        """
+        from .md import Markdown
         assert self.format == "md"
-        md = Markdown()
-        doc = md.parse(self.markup(context=context, env=env))
-        return get_markdown_elements(doc)
+        key = self.render_key(context, env)
+        document = _lookup(self._documents, key)
+        if document is None:
+            markup = self.markup(context=context, env=env)
+            with stats.stage("markdown_parse"):
+                document = Markdown().parse(markup)
+            _store(self._documents, key, document)
+        return document
+
+    def get_elements(self, context: Optional[dict] = None, env: Optional[Environment] = None) -> dict:
+        from .md import get_markdown_elements
+        cache = env.render_cache() if env is not None else None
+        if cache is not None:
+            key = self.cache_key(context, env, "elements")
+            elements = cache.get(key)
+            if elements is not None:
+                return json.loads(elements)
+
+        elements = get_markdown_elements(self.document(context=context, env=env))
+        if cache is not None:
+            cache.set(key, json.dumps(elements))
+        return elements
+
+
+def _lookup(cache: OrderedDict, key: str):
+    with _cache_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
 
-    def _render_template(self, context: Optional[dict], env: Optional[Environment]):
-        if context is None:
-            context = dict()
-        if env is None:
-            env = Environment()
 
-        template = env.jinja_env().from_string(
-            source=self.markup_template,
-        )
-        self._markup = template.render(**context)
+def _store(cache: OrderedDict, key: str, value):
+    with _cache_lock:
+        cache[key] = value
+        while len(cache) > MAX_CACHED_RENDERS:
+            cache.popitem(last=False)
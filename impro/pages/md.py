@@ -1,55 +1,156 @@
+import bisect
 import json
 import html
-from typing import Tuple, Optional, Dict
+import re
+from typing import List, Tuple, Optional, Dict
 
-from marko import Markdown, Renderer, HTMLRenderer, inline
+from marko import Markdown, Renderer, HTMLRenderer, block, inline
 
 
 def get_markdown_elements(element) -> dict:
-    r = ElementRenderer()
-    r.render(element)
+    """
+    Collect links, headings and images of a parsed markdown document.
+
+    The document is walked without rendering it, only the content
+    of headings and images is rendered to html.
+    """
+    renderer = HTMLRenderer()
+    links = set()
+    headings = []
+    images = []
+
+    todo = [element]
+    while todo:
+        element = todo.pop()
+
+        if isinstance(element, (block.Heading, block.SetextHeading)):
+            headings.append({"level": element.level, "text": renderer.render_children(element)})
+        elif isinstance(element, inline.Image):
+            images.append({"title": renderer.render_children(element), "src": element.dest})
+        elif isinstance(element, (inline.Link, inline.AutoLink)):
+            links.add(element.dest)
+
+        children = getattr(element, "children", None)
+        if children and not isinstance(children, str):
+            todo.extend(reversed(children))
+
     return {
-        "links": sorted(r.links),
-        "headings": r.headings,
-        "images": r.images,
+        "links": sorted(links),
+        "headings": headings,
+        "images": images,
     }
 
 
-def replace_markdown_element_links(element, link_mapping: Dict[str, str]):
-    if getattr(element, "dest", None) in link_mapping:
-        element.dest = link_mapping[element.dest]
+# Matches code, which is left untouched, and link destinations
+_MARKDOWN_LINK_PATTERN = re.compile(
+    # fenced code block
+    r"(?P<fence>^[ ]{0,3}(?P<fence_chars>`{3,}|~{3,}).*?(?:^[ ]{0,3}(?P=fence_chars)[`~]*[ \t]*$|\Z))"
+    # code span, not across paragraphs
+    r"|(?P<code>(?P<ticks>`+)(?:(?!\n[ \t]*\n).)+?(?<!`)(?P=ticks)(?!`))"
+    # html comment
+    r"|(?P<comment><!--.*?(?:-->|\Z))"
+    # inline link or image destination
+    r"|(?P<link>\]\([ \t]*)(?P<link_dest><[^>\n]*>|[^\s()<>]*(?:\([^\s()<>]*\)[^\s()<>]*)*)"
+    # link reference definition
+    r"|(?P<ref>^[ ]{0,3}\[[^\]\n]+\]:[ \t]*)(?P<ref_dest><[^>\n]*>|\S+)",
+    re.MULTILINE | re.DOTALL,
+)
+
+
+def replace_markdown_links(markdown: str, mapping: Dict[str, str]) -> str:
+    """
+    Replace the destinations of links, images and link reference definitions
+    in a single pass. Code spans, fenced and indented code blocks
+    and html comments are left untouched.
+    """
+    if not mapping:
+        return markdown
+
+    code_blocks = _indented_code_blocks(markdown)
+    code_starts = [start for start, _ in code_blocks]
+
+    def _replace(match: re.Match) -> str:
+        if code_blocks:
+            i = bisect.bisect_right(code_starts, match.start()) - 1
+            if i >= 0 and match.start() < code_blocks[i][1]:
+                return match.group(0)
+
+        for prefix in ("link", "ref"):
+            if match.group(prefix) is not None:
+                dest = match.group(f"{prefix}_dest")
+                if dest.startswith("<"):
+                    dest = dest[1:-1]
+                    if dest in mapping:
+                        return f"{match.group(prefix)}<{mapping[dest]}>"
+                elif dest in mapping:
+                    return f"{match.group(prefix)}{mapping[dest]}"
+                break
 
-    if getattr(element, "children", None) and not isinstance(element, inline.RawText):
-        for children in element.children:
-            replace_markdown_element_links(children, link_mapping)
+        return match.group(0)
 
+    return _MARKDOWN_LINK_PATTERN.sub(_replace, markdown)
 
-def replace_markdown_links(markdown: str, mapping: dict) -> str:
-    # TODO: Should actually use marko to rerender the markdown
-    for key, value in mapping.items():
-        markdown = markdown.replace(f"({key})", f"({value})")
-    return markdown
 
+def _indented_code_blocks(markdown: str) -> List[Tuple[int, int]]:
+    """
+    Return the (start, end) offsets of all indented code blocks.
 
-class ElementRenderer(HTMLRenderer):
+    Indented lines inside fenced code blocks and list items are not code blocks.
+    """
+    blocks = []
+    start = None
+    fence = None
+    in_list = False
+    previous_blank = True
+    pos = 0
+    for line in markdown.splitlines(keepends=True):
+        blank = not line.strip()
+        expanded = line.expandtabs(4)
+        indent = len(expanded) - len(expanded.lstrip())
 
-    def __init__(self):
+        if start is not None:
+            if blank or indent >= 4:
+                pos += len(line)
+                continue
+            blocks.append((start, pos))
+            start = None
+
+        if fence is not None:
+            if indent < 4 and line.strip().startswith(fence) and not line.strip().strip(fence[0]):
+                fence = None
+        elif not blank:
+            if indent >= 4 and previous_blank and not in_list:
+                start = pos
+            elif indent < 4:
+                fence_match = _FENCE_PATTERN.match(line.strip())
+                if fence_match:
+                    fence = fence_match.group(1)
+                if _LIST_ITEM_PATTERN.match(expanded):
+                    in_list = True
+                elif indent == 0 and previous_blank:
+                    in_list = False
+
+        previous_blank = blank
+        pos += len(line)
+
+    if start is not None:
+        blocks.append((start, pos))
+    return blocks
+
+
+_FENCE_PATTERN = re.compile(r"(`{3,}|~{3,})")
+_LIST_ITEM_PATTERN = re.compile(r"[ ]{0,3}(?:[-+*]|\d{1,9}[.)])(?:[ \t]|$)")
+
+
+class LinkReplaceHTMLRenderer(HTMLRenderer):
+    """
+    HTMLRenderer that maps link and image destinations through ``link_mapping``.
+
+    The document itself is not modified so it can be rendered again with a different mapping.
+    """
+    def __init__(self, link_mapping: Dict[str, str]):
         super().__init__()
-        self.links = set()
-        self.headings = []
-        self.images = []
-
-    def render_heading(self, element):
-        self.headings.append({
-            "level": element.level,
-            "text": self.render_children(element),
-        })
-        return super().render_heading(element)
-
-    def render_link(self, element):
-        self.links.add(element.dest)
-        return super().render_link(element)
-
-    def render_image(self, element):
-        self.images.append({"title": self.render_children(element), "src": element.dest})
-        return super().render_image(element)
+        self.link_mapping = link_mapping
+
+    def escape_url(self, raw: str) -> str:
+        return super().escape_url(self.link_mapping.get(raw, raw))
@@ -2,7 +2,8 @@ from pathlib import Path
 from typing import List, Union, Optional, TextIO, Dict
 
 from ..environment import Environment
-from ..util import sluggify, join_path
+from .. import stats
+from ..util import sluggify, join_path, hash_data
 from .markup import Markup
 from .md import replace_markdown_links
 
@@ -36,6 +37,10 @@ class Page:
 
     @property
     def title(self) -> str:
+        if self.markup.front_matter and "title" in self.markup.front_matter:
+            # does not require to read and render the markup
+            return self.markup.get_front_matter_value("title") or ""
+
         highest_heading = (100, "")
         for heading in self.elements["headings"]:
             if heading["level"] < highest_heading[0]:
@@ -70,6 +75,52 @@ class Page:
 
         return self.markup.get_front_matter_value("layout", layout)
 
+    def source_hash(self, format: str) -> str:
+        """
+        Hash of everything the output of ``to_<format>`` depends on,
+        except the associated files and the link mapping.
+
+        :param format: str, desired output format
+        :return: str, hex digest
+        """
+        import jinja2
+        import marko
+        from ..cache import RenderCache
+
+        data = [
+            RenderCache.VERSION,
+            format,
+            jinja2.__version__,
+            marko.__version__,
+            self.markup.format,
+            self.markup.markup_template,
+            self.markup.front_matter,
+            self.context,
+            str(self.markup.filename),
+            self.slug,
+        ]
+        for filename in self.template_files(format):
+            data.extend([str(filename), filename.read_bytes()])
+
+        return hash_data(*data)
+
+    def template_files(self, format: str) -> List[Path]:
+        """
+        All template files that the output of ``to_<format>`` depends on,
+        including the layout.
+        """
+        templates = self.env.template_dependencies(self.markup.markup_template)
+
+        layout = self.layout(format)
+        if layout:
+            layout_file = self.env.find_file(layout)
+            if not layout_file:
+                raise IOError(f"Can not find '{layout}'")
+            templates.append(layout_file)
+            templates.extend(self.env.template_dependencies(layout_file.read_text()))
+
+        return templates
+
     @classmethod
     def from_markdown(
             cls,
@@ -88,6 +139,14 @@ class Page:
         markup = Markup.from_file(file, format=format, env=env)
         return Page(markup, env=env)
 
+    def reload(self) -> "Page":
+        """
+        Return a new Page read from the same file
+        """
+        if not self.markup.filename:
+            raise ValueError(f"Can not reload {self} without filename")
+        return Page.from_file(self.markup.filename, format=self.markup.format, env=self._env_default)
+
     @property
     def env(self):
         if not self._env:
@@ -117,6 +176,14 @@ class Page:
 
         return self._files
 
+    def clear_cache(self):
+        """
+        Drop all rendered and parsed data, it is re-created on demand
+        """
+        self.markup.clear_cache()
+        self._elements = None
+        self._files = None
+
     def css_files(self) -> List[str]:
         css = self.markup.get_front_matter_value("css")
         if not css:
@@ -162,31 +229,60 @@ class Page:
         if self.markup.format == "md":
             markup = self.markup.markup(self.context, env=self.env)
             if link_mapping:
-                markup = replace_markdown_links(markup, link_mapping)
+                with stats.stage("link_rewrite"):
+                    markup = replace_markdown_links(markup, link_mapping)
             return markup
         else:
             raise NotImplementedError(self.markup.format)
 
     def to_html(self, link_mapping: Optional[Dict[str, str]] = None) -> str:
+        """
+        Render the page with it's layout.
+
+        If the environment has a ``render_cache``, the output is read from
+        and stored in the cache.
+        """
+        cache = self.env.render_cache()
+        if cache is None:
+            return self._to_html(link_mapping)
+
+        layout_context = self._layout_context(link_mapping) if self.layout("html") else None
+        key = hash_data("page", self.source_hash("html"), link_mapping, layout_context)
+        html = cache.get(key)
+        if html is None:
+            html = self._to_html(link_mapping)
+            cache.set(key, html)
+        return html
+
+    def _to_html(self, link_mapping: Optional[Dict[str, str]] = None) -> str:
         if self.markup.format == "md":
             html_body = self.markup.to_html(self.context, self.env, link_mapping=link_mapping)
             layout = self.layout("html")
             if not layout:
                 return html_body
 
-            markup = Markup.from_file(layout, format="html", env=self.env)
-            context = self.context.copy()
-            context.setdefault("html", {})
+            markup = Markup.from_layout(layout, format="html", env=self.env)
+            context = self._layout_context(link_mapping)
             context["html"].setdefault("body", html_body)
-            context["html"].setdefault("title", self.title)
-            context.setdefault("slug", self.slug)
-            if not context["html"].get("css"):
-                context["html"]["css"] = []
-            for file in self.css_files():
-                if link_mapping:
-                    file = link_mapping.get(file, file)
-                context["html"]["css"].append(file)
 
-            return markup.to_html(context=context, env=self.env, link_mapping=link_mapping)
+            with stats.stage("layout"):
+                return markup.render(context=context, env=self.env)
         else:
             raise NotImplementedError(self.markup.format)
+
+    def _layout_context(self, link_mapping: Optional[Dict[str, str]] = None) -> dict:
+        """
+        The context of the layout template, except the html body
+        """
+        context = self.context.copy()
+        context["html"] = dict(context.get("html") or {})
+        context["html"].setdefault("title", self.title)
+        context.setdefault("slug", self.slug)
+        context["html"]["css"] = list(context["html"].get("css") or [])
+        for file in self.css_files():
+            if link_mapping:
+                file = link_mapping.get(file, file)
+            # bundled stylesheets map to the same file
+            if file not in context["html"]["css"]:
+                context["html"]["css"].append(file)
+        return context
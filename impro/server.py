@@ -1,15 +1,278 @@
-from http.server import HTTPServer, BaseHTTPRequestHandler, HTTPStatus
+import contextlib
+import datetime
+import email.utils
+import hashlib
+import mimetypes
+import os
+import shutil
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler, HTTPStatus
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set, Tuple, Union
 import urllib.parse
 
+from .compress import GZIP_MIN_SIZE, accepts_gzip, gzip_bytes, is_compressible
+from .files import SourceFile
 from .site import Site
+from .util import hash_file
 
-global_site = None
-global_files = []
+
+class SiteServer(ThreadingHTTPServer):
+    """
+    HTTP server that renders the pages of a Site on demand.
+
+    Only the page routes are indexed on start. Each page is rendered on it's
+    first request and kept in a LRU cache of at most ``cache_size`` bytes.
+    Each connection is handled in it's own thread, different pages are
+    rendered concurrently.
+    """
+    daemon_threads = True
+
+    def __init__(
+            self,
+            address: Tuple[str, int],
+            site: Site,
+            format: str = "html",
+            cache_size: int = 64 * 1024 * 1024,
+    ):
+        super().__init__(address, RequestHandler)
+        self.site = site
+        self.format = format
+        self.cache_size = cache_size
+        # url path -> page key
+        self.routes: Dict[str, str] = site.page_routes(format)
+        # url path -> associated file of rendered pages
+        self.assets: Dict[str, SourceFile] = dict()
+        # url paths of assets that are named after their content hash
+        self.fingerprinted: Set[str] = set()
+        self._assets_indexed = False
+        self._cache: "OrderedDict[str, dict]" = OrderedDict()
+        # source file -> dict of "stat", "etag" and "gzip"
+        self._asset_info: Dict[Path, dict] = dict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        # url path -> lock, so each page is rendered only once at a time
+        self._page_locks: Dict[str, threading.Lock] = dict()
+        # source file -> lock, so each asset is hashed only once at a time
+        self._asset_locks: Dict[Path, threading.Lock] = dict()
+        self._index_lock = threading.Lock()
+        # renders wait while the watcher changes the site, and vice versa
+        self._site_condition = threading.Condition()
+        self._num_renders = 0
+        self._updating = False
+
+    def get_file(self, path: str) -> Optional[dict]:
+        """
+        Return the file for an url path, or None.
+
+        :return: dict with
+            - "content": bytes or SourceFile
+            - "etag": str, hash of the content
+            - "mtime": float, modification timestamp
+            - "gzip": None or bytes, the gzip compressed content
+        """
+        with self._lock:
+            file = self._cache.get(path)
+            if file is not None:
+                self._cache.move_to_end(path)
+                return file
+
+            source = self.assets.get(path)
+
+        if source is not None:
+            return self._asset_file(source)
+
+        if path in self.routes:
+            return self._render_page(path)
+
+        if not self._assets_indexed:
+            # an associated file was requested before it's page
+            with self._rendering(), self._index_lock:
+                if not self._assets_indexed:
+                    assets = self.site.associated_file_routes(self.format)
+                    fingerprinted = self.site.fingerprinted_file_routes(self.format)
+                    with self._lock:
+                        for filename, real_path in assets.items():
+                            self.assets.setdefault(filename, SourceFile(real_path))
+                        self.fingerprinted.update(fingerprinted)
+                        self._assets_indexed = True
+
+            with self._lock:
+                source = self.assets.get(path)
+            if source is not None:
+                return self._asset_file(source)
+
+    def update_pages(self, keys: Iterable[str]):
+        """
+        Update the routes after pages have been changed or reloaded
+        and render the changed pages again that are currently cached.
+        """
+        keys = set(keys)
+        with self._updating_site():
+            # created or deleted files can change which templates are found
+            self.site.clear_file_cache()
+            routes = self.site.page_routes(self.format)
+            with self._lock:
+                stale_paths = [
+                    path for path, key in self.routes.items()
+                    if key in keys or routes.get(path) != key
+                ]
+                cached_paths = [path for path in stale_paths if path in self._cache]
+                for path in cached_paths:
+                    self._cache_bytes -= len(self._cache.pop(path)["content"])
+                self.routes = routes
+
+        for path in cached_paths:
+            if path in self.routes:
+                self._render_page(path)
+
+    def start_watching(self, interval: float = .5) -> threading.Thread:
+        """
+        Start a thread that watches the page files and templates
+        and updates the changed pages.
+        """
+        from .watch import SiteWatcher
+
+        def _watch():
+            with self._updating_site():
+                watcher = SiteWatcher(self.site, self.format, interval=interval)
+            while True:
+                changed = watcher.wait()
+                try:
+                    with self._updating_site():
+                        keys, _ = watcher.apply(changed)
+                    self.update_pages(keys)
+                except Exception:
+                    traceback.print_exc()
+
+        thread = threading.Thread(target=_watch, daemon=True)
+        thread.start()
+        return thread
+
+    def _asset_file(self, source: SourceFile) -> Optional[dict]:
+        try:
+            stat = source.path.stat()
+        except FileNotFoundError:
+            # deleted while the server is running
+            with self._lock:
+                self._asset_info.pop(source.path, None)
+            return None
+
+        file_stat = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            info = self._asset_info.get(source.path)
+            asset_lock = self._asset_locks.setdefault(source.path, threading.Lock())
+
+        if info is None or info["stat"] != file_stat:
+            # hashing and compressing a large file only blocks requests for the same file
+            with asset_lock:
+                with self._lock:
+                    info = self._asset_info.get(source.path)
+                if info is None or info["stat"] != file_stat:
+                    info = {
+                        "stat": file_stat,
+                        "etag": hash_file(source.path),
+                        "gzip": None,
+                    }
+                    if is_compressible(source.path) and stat.st_size >= GZIP_MIN_SIZE:
+                        info["gzip"] = gzip_bytes(source.read())
+                    with self._lock:
+                        self._asset_info[source.path] = info
+
+        return {
+            "content": source,
+            "etag": info["etag"],
+            "mtime": stat.st_mtime,
+            "gzip": info["gzip"],
+        }
+
+    def _render_page(self, path: str) -> Optional[dict]:
+        with self._lock:
+            page_lock = self._page_locks.setdefault(path, threading.Lock())
+
+        with self._rendering(), page_lock:
+            with self._lock:
+                if path in self._cache:
+                    return self._cache[path]
+
+            key = self.routes.get(path)
+            if key is None:
+                # removed by ``update_pages`` in the meantime
+                return None
+
+            rendered = self.site.render_page(key, self.format)
+            # the output is cached here, the intermediate data is not needed anymore
+            self.site.get_page(key).clear_cache()
+
+            content = rendered["content"].encode("utf-8")
+            file = {
+                "content": content,
+                "etag": hashlib.sha256(content).hexdigest(),
+                "mtime": time.time(),
+                "gzip": None,
+            }
+            if is_compressible(path) and len(content) >= GZIP_MIN_SIZE:
+                file["gzip"] = gzip_bytes(content)
+            with self._lock:
+                for asset in rendered["files"]:
+                    self.assets.setdefault(asset["export_path"], SourceFile(asset["real_path"]))
+                    if asset["fingerprinted"]:
+                        self.fingerprinted.add(asset["export_path"])
+
+                self._cache[path] = file
+                self._cache_bytes += len(content)
+                while self._cache_bytes > self.cache_size and len(self._cache) > 1:
+                    _, evicted = self._cache.popitem(last=False)
+                    self._cache_bytes -= len(evicted["content"])
+
+        return file
+
+    @contextlib.contextmanager
+    def _rendering(self):
+        with self._site_condition:
+            while self._updating:
+                self._site_condition.wait()
+            self._num_renders += 1
+        try:
+            yield
+        finally:
+            with self._site_condition:
+                self._num_renders -= 1
+                self._site_condition.notify_all()
+
+    @contextlib.contextmanager
+    def _updating_site(self):
+        with self._site_condition:
+            while self._updating:
+                self._site_condition.wait()
+            self._updating = True
+            while self._num_renders:
+                self._site_condition.wait()
+        try:
+            yield
+        finally:
+            with self._site_condition:
+                self._updating = False
+                self._site_condition.notify_all()
 
 
 class RequestHandler(BaseHTTPRequestHandler):
 
+    # enables keep-alive, requires a Content-Length header on every response
+    protocol_version = "HTTP/1.1"
+
+    server: SiteServer
+
     def do_GET(self):
+        self.send_file(head=False)
+
+    def do_HEAD(self):
+        self.send_file(head=True)
+
+    def send_file(self, head: bool):
         path = self.path.split('?', 1)[0]
         path = path.split('#', 1)[0]
         try:
@@ -17,36 +280,99 @@ class RequestHandler(BaseHTTPRequestHandler):
         except UnicodeDecodeError:
             path = urllib.parse.unquote(path)
 
-        for filename, content in global_files:
-            filename = str(filename)
-            if filename != path:
-                continue
+        file = self.server.get_file(path)
+        if file is None:
+            self.send_file_listing(head=head)
+            #return self.send_error(HTTPStatus.NOT_FOUND)
+            return
 
-            if filename.endswith(".html"):
-                content_type = "text/html"
-            elif filename.endswith(".css"):
-                content_type = "text/css"
-            else:
-                content_type = ""
+        if path.endswith(".html"):
+            content_type = "text/html"
+        elif path.endswith(".css"):
+            content_type = "text/css"
+        else:
+            content_type = mimetypes.guess_type(path)[0] or ""
 
-            if isinstance(content, str):
-                content = content.encode("utf-8")
+        content = file["content"]
+        etag = f'"{file["etag"]}"'
+        encoding = None
+        if file["gzip"] is not None and accepts_gzip(self.headers.get("Accept-Encoding")):
+            content = file["gzip"]
+            etag = f'"{file["etag"]}-gzip"'
+            encoding = "gzip"
 
+        if path in self.server.fingerprinted:
+            cache_control = "public, max-age=31536000, immutable"
+        else:
+            cache_control = "no-cache"
+
+        if self.is_not_modified(etag, file["mtime"]):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", cache_control)
+            if file["gzip"] is not None:
+                self.send_header("Vary", "Accept-Encoding")
+            self.end_headers()
+            return
+
+        fp = None
+        length = len(content) if not isinstance(content, SourceFile) else 0
+        if isinstance(content, SourceFile):
+            try:
+                fp = content.open()
+            except FileNotFoundError:
+                return self.send_file_listing(head=head)
+            length = os.fstat(fp.fileno()).st_size
+
+        with fp or contextlib.nullcontext():
             self.send_response(HTTPStatus.OK)
             self.send_header("Content-type", content_type)
-            self.send_header("Content-Length", str(len(content)))
-            #self.send_header("Last-Modified", self.date_time_string(fs.st_mtime))
+            self.send_header("Content-Length", str(length))
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
+            if file["gzip"] is not None:
+                self.send_header("Vary", "Accept-Encoding")
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", self.date_time_string(file["mtime"]))
+            self.send_header("Cache-Control", cache_control)
             self.end_headers()
-            self.wfile.write(content)
-            return
 
-        self.send_file_listing()
-        #return self.send_error(HTTPStatus.NOT_FOUND)
+            if head:
+                return
 
-    def send_file_listing(self):
+            if fp is not None:
+                shutil.copyfileobj(fp, self.wfile)
+            else:
+                self.wfile.write(content)
+
+    def is_not_modified(self, etag: str, mtime: float) -> bool:
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            # If-Modified-Since is ignored when If-None-Match is present
+            for tag in if_none_match.split(","):
+                tag = tag.strip()
+                if tag.startswith("W/"):
+                    tag = tag[2:]
+                if tag == "*" or tag == etag:
+                    return True
+            return False
+
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since is not None:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            if since.tzinfo is None:
+                since = since.replace(tzinfo=datetime.timezone.utc)
+            return int(mtime) <= since.timestamp()
+
+        return False
+
+    def send_file_listing(self, head: bool = False):
         markup = '<ul>'
-        for filename, content in global_files:
-            markup += f'<li><a href="{filename}">{filename}</a> {len(content):,d}</li>'
+        for filename in sorted(self.server.routes):
+            markup += f'<li><a href="{filename}">{filename}</a></li>'
         markup += '</ul>'
 
         markup = markup.encode("utf-8")
@@ -55,13 +381,13 @@ class RequestHandler(BaseHTTPRequestHandler):
         self.send_header("Content-type", "text/html")
         self.send_header("Content-Length", str(len(markup)))
         self.end_headers()
-        self.wfile.write(markup)
+        if not head:
+            self.wfile.write(markup)
 
 
-def run_server(site: Site):
-    global global_site, global_files
-    global_site = site
-    global_files = list(site.iter_files("html"))
-    server = HTTPServer(("", 8000), RequestHandler)
+def run_server(site: Site, host: str = "", port: int = 8000, watch: bool = False):
+    server = SiteServer((host, port), site)
+    if watch:
+        server.start_watching()
+    print(f"Serving {site} on http://{host or 'localhost'}:{server.server_port}")
     server.serve_forever()
-
@@ -1,10 +1,23 @@
 import os
+import posixpath
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Tuple, Union, Optional, Type, Generator, Dict
+from typing import List, Tuple, Union, Optional, Type, Generator, Dict, Iterable, Set
 
+from . import stats
+from .compress import compress_files
+from .environment import Environment
 from .pages import Page
-from .util import join_path, relative_path
-from .writer import FileWriter
+from .manifest import BuildManifest
+from .util import join_path, relative_path, hash_data, hash_file, stat_cached
+from .files import SourceFile, find_files
+from .styles import bundle_styles, style_sources
+from .writer import Writer, FileWriter, MemoryWriter, BackgroundWriter, Content
+
+
+# path -> ((mtime, size), content hash) of associated files, see ``_fingerprint_filename``
+_file_hashes: Dict[Path, tuple] = dict()
 
 
 class Site:
@@ -12,21 +25,92 @@ class Site:
     def __init__(
             self,
             file_type_path_mapping: Optional[Dict[str, str]] = None,
+            fingerprint_path: Optional[str] = None,
+            css_bundle_path: Optional[str] = None,
+            minify_css: bool = False,
+            style_cache_path: Optional[Union[str, Path]] = None,
     ):
+        """
+        :param file_type_path_mapping: optional dict of associated file type -> export path,
+            e.g. ``{"image": "/img"}``
+        :param fingerprint_path: optional export path, e.g. "/assets". If set, all associated
+            files are exported there under the first 16 characters of their content hash,
+            files with identical content are only written once.
+        :param css_bundle_path: optional export path, e.g. "/css". If set, the stylesheets
+            of each html page are compiled (scss requires pyScss) and concatenated into one
+            bundle, which is shared by all pages with the same stylesheets.
+        :param minify_css: bool, minify the bundled stylesheets
+        :param style_cache_path: optional directory for the bundles, which can be
+            kept between builds. Defaults to a temporary directory.
+        """
         self._pages = dict()
         self._files: Optional[List[dict]] = None
+        self._style_temp_dir: Optional[tempfile.TemporaryDirectory] = None
         self.file_type_path_mapping = file_type_path_mapping or dict()
+        self.fingerprint_path = fingerprint_path
+        self.css_bundle_path = css_bundle_path
+        self.minify_css = minify_css
+        self.style_cache_path = Path(style_cache_path) if style_cache_path is not None else None
+
+    @classmethod
+    def from_directory(
+            cls,
+            root: Union[str, Path],
+            include: Iterable[str] = ("*.md",),
+            exclude: Iterable[str] = (".*",),
+            path: Optional[str] = None,
+            env: Optional[Environment] = None,
+            workers: Optional[int] = None,
+            file_type_path_mapping: Optional[Dict[str, str]] = None,
+            fingerprint_path: Optional[str] = None,
+    ) -> "Site":
+        """
+        Create a Site from all matching files below a directory, see ``add_directory``
+        """
+        site = cls(file_type_path_mapping=file_type_path_mapping, fingerprint_path=fingerprint_path)
+        site.add_directory(root, include=include, exclude=exclude, path=path, env=env, workers=workers)
+        return site
+
+    def add_directory(
+            self,
+            root: Union[str, Path],
+            include: Iterable[str] = ("*.md",),
+            exclude: Iterable[str] = (".*",),
+            path: Optional[str] = None,
+            env: Optional[Environment] = None,
+            workers: Optional[int] = None,
+    ):
+        """
+        Add all matching files below a directory as pages.
+
+        Sub-directories become the page paths, e.g. ``root/guide/intro.md``
+        is added with path ``guide``, or ``<path>/guide`` if ``path`` is given.
+
+        :param root: the directory
+        :param include: file patterns, see ``files.find_files``
+        :param exclude: file and directory patterns, see ``files.find_files``
+        :param path: optional page path for the files directly in ``root``
+        :param env: optional Environment for all pages
+        :param workers: optional int, number of threads reading the front-matter
+        """
+        root = Path(root).absolute()
+        files = find_files(root, include=include, exclude=exclude)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pages = list(executor.map(lambda f: Page.from_file(f[1], env=env), files))
+
+        for (rel_dir, _), page in zip(files, pages):
+            page_path = path
+            if rel_dir:
+                page_path = join_path(path, rel_dir) if path else rel_dir
+            self.add_page(page, path=page_path)
 
     def add_page(self, *page: Page, path: Optional[str] = None):
         for page in page:
             if not page.slug:
                 raise ValueError(f"Can not add page without a slug: {page}")
 
-            if path is not None:
-                key = f"{path}/{page.slug}"
-            else:
-                key = page.slug
-
+            key = self._page_key(page, path)
             if key in self._pages:
                 raise ValueError(f"Trying to add page with existing path and slug '{key}'")
 
@@ -37,6 +121,41 @@ class Site:
 
         self._files = None
 
+    def reload_page(self, key: str) -> str:
+        """
+        Re-read a page from it's file.
+
+        :return: str, the new key of the page, which changes with the slug
+        """
+        p = self._pages[key]
+        page = p["page"].reload()
+        new_key = self._page_key(page, p["path"])
+        if new_key != key and new_key in self._pages:
+            raise ValueError(f"Trying to reload page with existing path and slug '{new_key}'")
+
+        self._pages = {
+            (new_key if k == key else k): ({"path": p["path"], "page": page} if k == key else v)
+            for k, v in self._pages.items()
+        }
+        self._files = None
+        return new_key
+
+    def page_keys(self) -> List[str]:
+        return list(self._pages)
+
+    def clear_file_cache(self):
+        """
+        Clear the ``find_file`` caches of the environments of all pages,
+        after files have been created or deleted.
+        """
+        for p in self._pages.values():
+            p["page"].env.clear_file_cache()
+
+    def _page_key(self, page: Page, path: Optional[str]) -> str:
+        if path is not None:
+            return f"{path}/{page.slug}"
+        return page.slug
+
     @property
     def associated_files(self) -> List[dict]:
         if self._files is None:
@@ -57,74 +176,427 @@ class Site:
 
         return self._files
 
+    def style_options(self, format: str) -> Optional[dict]:
+        """
+        The options of the stylesheet bundling for the output format, or None
+        """
+        if format != "html" or not self.css_bundle_path:
+            return None
+
+        path = self.style_cache_path
+        if path is None:
+            if self._style_temp_dir is None:
+                self._style_temp_dir = tempfile.TemporaryDirectory(prefix="impro-styles-")
+            path = Path(self._style_temp_dir.name)
+
+        return {
+            "export_path": self.css_bundle_path,
+            "path": path,
+            "minify": self.minify_css,
+        }
+
+    def index(self, format: str = "html") -> List[dict]:
+        """
+        Return the metadata of all pages without rendering any output.
+
+        Each page's markup is rendered with it's context and parsed once,
+        layouts are not used and no html is generated.
+
+        :param format: str, output format for the "filename" of each page
+        :return: list of dict with "key", "path", "slug", "filename", "title",
+            "front_matter", "headings", "links" and "files"
+        """
+        index = []
+        for key, p in self._pages.items():
+            page: Page = p["page"]
+            elements = page.elements
+            index.append({
+                "key": key,
+                "path": p["path"],
+                "slug": page.slug,
+                "filename": _page_filename(page, p["path"], format),
+                "title": page.title,
+                "front_matter": page.markup.front_matter,
+                "headings": elements["headings"],
+                "links": elements["links"],
+                "files": [
+                    {"type": file["type"], "path": file["path"], "external": file["external"]}
+                    for file in page.associated_files
+                ],
+            })
+        return index
+
+    def get_page(self, key: str) -> Page:
+        return self._pages[key]["page"]
+
+    def page_routes(self, format: str) -> Dict[str, str]:
+        """
+        Return a dict of output filename -> page key for all pages,
+        without rendering anything.
+        """
+        routes = dict()
+        for key, p in self._pages.items():
+            routes[_page_filename(p["page"], p["path"], format)] = key
+        return routes
+
+    def associated_file_routes(self, format: str = "html") -> Dict[str, Path]:
+        """
+        Return a dict of output filename -> source file for all
+        non-external associated files of all pages.
+        """
+        routes = dict()
+        for file in self._export_files(format):
+            routes.setdefault(file["export_path"], file["real_path"])
+        return routes
+
+    def style_sources(self, key: str, format: str) -> List[Path]:
+        """
+        Return the stylesheets of a page that are bundled, and their scss imports,
+        or an empty list if stylesheets are not bundled for the format.
+        """
+        if self.style_options(format) is None:
+            return []
+        return style_sources([
+            Path(file["abs_path"])
+            for file in self.get_page(key).associated_files
+            if file["type"] == "css" and not file["external"]
+        ])
+
+    def fingerprinted_file_routes(self, format: str = "html") -> Set[str]:
+        """
+        Return the output filenames of all associated files that are named
+        after their content hash, see ``fingerprint_path`` and ``css_bundle_path``.
+        The content of these files never changes.
+        """
+        return {
+            file["export_path"]
+            for file in self._export_files(format)
+            if file["fingerprinted"]
+        }
+
+    def _export_files(self, format: str) -> Iterable[dict]:
+        styles = self.style_options(format)
+        for p in self._pages.values():
+            files, _ = _page_files(
+                p["page"], p["path"], self.file_type_path_mapping, self.fingerprint_path, styles,
+            )
+            yield from files
+
+    def render_page(self, key: str, format: str) -> dict:
+        """
+        Render a single page.
+
+        :param key: str, the page key, see ``page_routes``
+        :param format: str, output format, "md" or "html"
+        :return: dict with "filename", "content" and the list of associated "files",
+            each with "real_path" and "export_path"
+        """
+        p = self._pages[key]
+        return _render_page_job((
+            p["page"], p["path"], format, self.file_type_path_mapping, self.fingerprint_path,
+            self.style_options(format), False,
+        ))
+
     def write_files(
             self,
             root: Union[str, Path],
             format: str,
-            writer: Optional[Type[FileWriter]] = None,
-    ) -> FileWriter:
+            writer: Optional[Union[Writer, Type[Writer]]] = None,
+            workers: Optional[int] = None,
+            manifest: Optional[BuildManifest] = None,
+            compress: bool = False,
+    ) -> Writer:
+        """
+        Render and write all files of the site.
+
+        :param root: output directory
+        :param format: str, output format, "md" or "html"
+        :param writer: optional Writer class or instance, e.g. a BackgroundWriter
+        :param workers: optional number of render processes, see ``iter_files``
+        :param manifest: optional BuildManifest of a previous build into ``root``.
+            Unchanged files are skipped, files that are not part of the site anymore
+            are removed and the manifest is saved with the new state.
+        :param compress: bool, write a gzip compressed ``.gz`` sibling
+            for each compressible file, see ``compress.compress_files``
+        """
         if writer is None:
             writer = FileWriter(root=root)
-        else:
+        elif not isinstance(writer, Writer):
             writer = writer(root=root)
 
-        for filename, content in self.iter_files(format=format):
-            writer.write(filename, content)
+        file_writer = writer.writer if isinstance(writer, BackgroundWriter) else writer
+        if compress and (not isinstance(file_writer, FileWriter) or isinstance(file_writer, MemoryWriter)):
+            raise TypeError(f"compress requires a FileWriter, got '{type(file_writer).__name__}'")
+
+        try:
+            filenames = []
+            for filename, content in self.iter_files(format=format, workers=workers, manifest=manifest):
+                with stats.stage("write"):
+                    writer.write(filename, content)
+                if stats.active():
+                    stats.count("files_written")
+                    stats.count("bytes_written", len(content.encode("utf-8") if isinstance(content, str) else content))
+                filenames.append(filename)
+
+            if manifest is not None:
+                for filename in manifest.stale_files():
+                    writer.remove(filename)
+                    if compress:
+                        writer.remove(filename + ".gz")
+                    manifest.deleted.append(filename)
+                for filename in manifest.skipped:
+                    writer.keep(filename)
+                writer.keep(manifest.FILENAME)
+                filenames.extend(manifest.skipped)
+
+            if compress:
+                writer.flush()
+                with stats.stage("compress"):
+                    gz_filenames = compress_files(
+                        [writer.full_filename(filename) for filename in filenames],
+                        workers=workers,
+                    )
+                for gz_filename in gz_filenames:
+                    writer.keep(gz_filename.relative_to(writer.root))
+        except BaseException:
+            # e.g. removes a partial archive
+            writer.abort()
+            raise
+
+        with stats.stage("write"):
+            writer.close()
+
+        if manifest is not None:
+            manifest.save()
 
         return writer
 
     def iter_files(
             self,
             format: str,
-    ) -> Generator[Tuple[Path, Union[str, bytes]], None, None]:
-        assert format in ("md", "html")
+            workers: Optional[int] = None,
+            manifest: Optional[BuildManifest] = None,
+    ) -> Generator[Tuple[Path, Content], None, None]:
+        """
+        Render all pages and yield their filenames and contents,
+        along with the associated files of each page.
 
-        handled_real_path_set = set()
-        real_files = []
-        page_files = []
+        :param format: str, output format, "md" or "html"
+        :param workers: optional int, if larger than 1 the pages are rendered
+            in a pool of that many processes. Files are yielded in the same order.
+        :param manifest: optional BuildManifest, files that are unchanged
+            since the previous build are not yielded.
+        """
+        assert format in ("md", "html")
 
+        styles = self.style_options(format)
+        jobs = []
+        page_inputs = []
         for p in self._pages.values():
             page = p["page"]
-            page_path = p["path"]
             if not page.slug:
                 raise ValueError(f"Slug required for {page}")
 
-            page_link_mapping = dict()
+            if manifest is not None:
+                with stats.stage("manifest"):
+                    inputs = [page.source_hash(format), p["path"], self.file_type_path_mapping]
+                    if self.fingerprint_path or styles:
+                        # the links in the page change with the content of the associated files
+                        inputs.append(_page_files(
+                            page, p["path"], self.file_type_path_mapping, self.fingerprint_path, styles,
+                        )[1])
+                    inputs = hash_data(*inputs)
+                filename = _page_filename(page, p["path"], format)
+                if manifest.is_unchanged(filename, inputs):
+                    manifest.skip(filename)
+                    stats.count("files_skipped")
+                    continue
+                page_inputs.append(inputs)
 
-            for file in page.associated_files:
-                if not file["external"]:
-                    real_file_path = Path(file["abs_path"])
-                    file_path = file["path"]
+            jobs.append((
+                page, p["path"], format, self.file_type_path_mapping, self.fingerprint_path, styles,
+                stats.active() is not None,
+            ))
+
+        if workers is not None and workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                yield from self._iter_rendered_files(executor.map(
+                    _render_page_job, jobs,
+                    chunksize=max(1, len(jobs) // (workers * 4)),
+                ), manifest, page_inputs)
+        else:
+            yield from self._iter_rendered_files(
+                (_render_page_job(job) for job in jobs), manifest, page_inputs,
+            )
+
+    def _iter_rendered_files(
+            self,
+            rendered_pages: Iterable[dict],
+            manifest: Optional[BuildManifest] = None,
+            page_inputs: Optional[List[str]] = None,
+    ) -> Generator[Tuple[Path, Content], None, None]:
+        # files with the same export path, e.g. identical fingerprinted files, are written once
+        handled_export_path_set = set()
+
+        for i, rendered in enumerate(rendered_pages):
+            if "stats" in rendered:
+                stats.active().merge(rendered.pop("stats"))
+
+            for file in rendered["files"]:
+                real_file_path = file["real_path"]
+                export_file_path = file["export_path"]
+                if export_file_path not in handled_export_path_set:
+                    handled_export_path_set.add(export_file_path)
+
+                    if manifest is not None:
+                        inputs = manifest.file_hash(real_file_path)
+                        if manifest.is_unchanged(export_file_path, inputs):
+                            if export_file_path not in manifest.new_entries:
+                                manifest.skip(export_file_path)
+                                stats.count("files_skipped")
+                            continue
+                        manifest.add(export_file_path, inputs)
+
+                    yield Path(export_file_path), SourceFile(real_file_path)
+
+            if manifest is not None:
+                manifest.add(
+                    rendered["filename"], page_inputs[i],
+                    sources=[file["real_path"] for file in rendered["files"]],
+                    assets=[file["export_path"] for file in rendered["files"]],
+                )
+
+            yield Path(rendered["filename"]), rendered["content"]
+
+
+def _render_page_job(job: tuple) -> dict:
+    """
+    Render a single page of a Site.
+
+    This is a module-level function so it can be passed to a process pool.
+
+    :param job: tuple of (Page, page path, format, file_type_path_mapping, fingerprint_path,
+        style options, collect stats).
+        If stats should be collected but no BuildStats is active, e.g. in a worker process,
+        the stats of the page are returned in "stats", see ``BuildStats.to_dict``.
+    :return: dict with "filename", "content" and the list of associated "files"
+    """
+    page, page_path, format, file_type_path_mapping, fingerprint_path, styles, collect_stats = job
+
+    if collect_stats and stats.active() is None:
+        with stats.BuildStats() as page_stats:
+            rendered = _render_page_job(job[:-1] + (False,))
+        rendered["stats"] = page_stats.to_dict()
+        return rendered
+
+    filename = _page_filename(page, page_path, format)
+
+    with stats.page(filename), stats.stage("page"):
+        files, page_link_mapping = _page_files(page, page_path, file_type_path_mapping, fingerprint_path, styles)
+
+        content = getattr(page, f"to_{format}")(link_mapping=page_link_mapping)
+
+    return {
+        "filename": filename,
+        "content": content,
+        "files": files,
+    }
+
+
+def _page_files(
+        page: Page,
+        page_path: Optional[str],
+        file_type_path_mapping: Dict[str, str],
+        fingerprint_path: Optional[str] = None,
+        styles: Optional[dict] = None,
+) -> Tuple[List[dict], Dict[str, str]]:
+    """
+    Return the list of non-external associated files of a page,
+    with their "real_path", "export_path" and "fingerprinted", and the link mapping for the page.
+    "fingerprinted" is True if the export path is named after the file's content hash.
+
+    If ``styles`` are given, see ``Site.style_options``, the stylesheets
+    are replaced by one bundle.
+    """
+    page_link_mapping = dict()
+    files = []
+    style_files = []
+
+    associated_files = page.associated_files
+    if styles:
+        style_files = [f for f in associated_files if f["type"] == "css" and not f["external"]]
+        associated_files = [f for f in associated_files if f not in style_files]
+        if style_files:
+            # relative urls in the stylesheets point to where they would be exported without bundling
+            bases = []
+            for file in style_files:
+                if file["type"] in file_type_path_mapping:
+                    export_file_path = join_path(file_type_path_mapping[file["type"]], file["path"])
+                else:
+                    export_file_path = join_path(page_path or "/", file["path"])
+                bases.append(posixpath.dirname("/" + export_file_path.lstrip("/")))
+
+            bundle = bundle_styles(
+                [Path(f["abs_path"]) for f in style_files], styles["path"], minify=styles["minify"], bases=bases,
+            )
+            associated_files.append({
+                "type": "css",
+                "external": False,
+                "path": join_path(styles["export_path"], bundle.name),
+                "abs_path": str(bundle),
+                "bundle": True,
+            })
+
+    for file in associated_files:
+        if not file["external"]:
+            real_file_path = Path(file["abs_path"])
+            file_path = file["path"]
+
+            if not real_file_path.exists():
+                raise IOError(
+                    f"Associated file '{real_file_path}' does not exist for '{page}'"
+                )
+
+            if fingerprint_path:
+                export_file_path = join_path(fingerprint_path, _fingerprint_filename(real_file_path))
+            elif file["type"] in file_type_path_mapping:
+                export_file_path = join_path(file_type_path_mapping[file["type"]], file_path)
+            else:
+                export_file_path = join_path(page_path or "/", file_path)
 
-                    if file["type"] in self.file_type_path_mapping:
-                        export_file_path = join_path(self.file_type_path_mapping[file["type"]], file_path)
-                    else:
-                        export_file_path = join_path(page_path, file_path)
+            if not export_file_path.startswith("/"):
+                export_file_path = "/" + export_file_path
+            #export_file_path = relative_path(export_file_path, page_path)
 
-                    if not export_file_path.startswith("/"):
-                        export_file_path = "/" + export_file_path
-                    #export_file_path = relative_path(export_file_path, page_path)
+            if file_path != export_file_path:
+                page_link_mapping[file_path] = export_file_path
 
-                    if file_path != export_file_path:
-                        page_link_mapping[file_path] = export_file_path
+            files.append({
+                "real_path": real_file_path,
+                "export_path": export_file_path,
+                # bundles are named after the hash of their inputs
+                "fingerprinted": bool(fingerprint_path or file.get("bundle")),
+            })
 
-                    if real_file_path not in handled_real_path_set:
-                        handled_real_path_set.add(real_file_path)
+    if style_files:
+        bundle_export_path = files[-1]["export_path"]
+        for file in style_files:
+            page_link_mapping[file["path"]] = bundle_export_path
 
-                        if not real_file_path.exists():
-                            raise IOError(
-                                f"Associated file '{real_file_path}' does not exist for '{page}'"
-                            )
+    return files, page_link_mapping
 
-                        with open(real_file_path, "rb") as fp:
-                            yield Path(export_file_path), fp.read()
 
-            filename = f"{page.slug}.{format}"
-            if page_path:
-                filename = join_path(page_path, filename)
-            if not filename.startswith("/"):
-                filename = "/" + filename
+def _fingerprint_filename(path: Path) -> str:
+    """
+    Return the content-addressed filename of a file, e.g. "0123456789abcdef.png"
+    """
+    return stat_cached(_file_hashes, path, hash_file)[:16] + path.suffix.lower()
 
-            content = getattr(page, f"to_{format}")(link_mapping=page_link_mapping)
 
-            yield Path(filename), content
+def _page_filename(page: Page, page_path: Optional[str], format: str) -> str:
+    filename = f"{page.slug}.{format}"
+    if page_path:
+        filename = join_path(page_path, filename)
+    if not filename.startswith("/"):
+        filename = "/" + filename
+    return filename
@@ -0,0 +1,222 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+
+# the BuildStats that is currently collecting, see ``BuildStats.__enter__``
+_active: Optional["BuildStats"] = None
+
+_NULL_CONTEXT = contextlib.nullcontext()
+
+
+class BuildStats:
+    """
+    Collects wall and CPU time per stage and per page, and counters
+    like bytes read and written or cache hits.
+
+    Collecting is enabled by using the instance as context manager::
+
+        with BuildStats() as stats:
+            site.write_files(...)
+        stats.save("build.json")
+
+    Stages can be nested. The times of a stage do not include the times
+    of it's nested stages, so the stage times add up to the total time.
+
+    When no BuildStats is active, ``stage`` and ``count`` do nothing.
+
+    Stages and pages are tracked per thread. The cpu time is the time
+    of the whole process, so with threads it includes the other threads.
+    """
+    def __init__(self):
+        # stage -> dict of "count", "wall", "cpu"
+        self.stages: Dict[str, dict] = dict()
+        # page -> dict of "wall", "cpu" and "stages": stage -> wall
+        self.pages: Dict[str, dict] = dict()
+        self.counters: Dict[str, int] = dict()
+        self.wall = 0.
+        self.cpu = 0.
+        # "stack": list of open stages, "page": str or None, per thread
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._previous: Optional[BuildStats] = None
+        self._start = None
+        self._pid = None
+
+    def __enter__(self) -> "BuildStats":
+        global _active
+        self._previous = _active
+        _active = self
+        self._pid = os.getpid()
+        self._start = (time.perf_counter(), time.process_time())
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        global _active
+        self.wall += time.perf_counter() - self._start[0]
+        self.cpu += time.process_time() - self._start[1]
+        _active = self._previous
+        self._previous = None
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        # [name, wall start, cpu start, nested wall, nested cpu]
+        entry = [name, time.perf_counter(), time.process_time(), 0., 0.]
+        stack = self._stack()
+        stack.append(entry)
+        try:
+            yield
+        finally:
+            stack.pop()
+            wall = time.perf_counter() - entry[1]
+            cpu = time.process_time() - entry[2]
+            if stack:
+                stack[-1][3] += wall
+                stack[-1][4] += cpu
+            self._add_stage(name, 1, wall - entry[3], cpu - entry[4], page=self._current_page())
+
+    @contextlib.contextmanager
+    def page(self, name: str):
+        """
+        Attribute all stages until exit to the page ``name``
+        """
+        previous, self._local.page = self._current_page(), name
+        start = (time.perf_counter(), time.process_time())
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start[0]
+            cpu = time.process_time() - start[1]
+            with self._lock:
+                page = self.pages.setdefault(name, {"wall": 0., "cpu": 0., "stages": dict()})
+                page["wall"] += wall
+                page["cpu"] += cpu
+            self._local.page = previous
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, data: dict):
+        """
+        Add the stages, pages and counters of another BuildStats' ``to_dict``,
+        e.g. from a worker process.
+        """
+        for name, stage in data["stages"].items():
+            self._add_stage(name, stage["count"], stage["wall"], stage["cpu"])
+        with self._lock:
+            for name, page in data["pages"].items():
+                p = self.pages.setdefault(name, {"wall": 0., "cpu": 0., "stages": dict()})
+                p["wall"] += page["wall"]
+                p["cpu"] += page["cpu"]
+                for stage, wall in page["stages"].items():
+                    p["stages"][stage] = p["stages"].get(stage, 0.) + wall
+        for name, value in data["counters"].items():
+            self.count(name, value)
+
+    def to_dict(self) -> dict:
+        return {
+            "stages": self.stages,
+            "pages": self.pages,
+            "counters": self.counters,
+        }
+
+    def slowest_pages(self, top: int = 10) -> List[dict]:
+        """
+        :return: list of dict with "page", "wall", "cpu" and "stages", slowest first
+        """
+        pages = sorted(self.pages.items(), key=lambda p: -p[1]["wall"])
+        return [{"page": name, **page} for name, page in pages[:top]]
+
+    def report(self, top: int = 10) -> dict:
+        return {
+            "wall": self.wall,
+            "cpu": self.cpu,
+            "stages": self.stages,
+            "counters": self.counters,
+            "num_pages": len(self.pages),
+            "slowest_pages": self.slowest_pages(top),
+            "pages": self.pages,
+        }
+
+    def save(self, filename: Union[str, Path], top: int = 10):
+        Path(filename).write_text(json.dumps(self.report(top), indent=2))
+
+    def summary(self, top: int = 10) -> str:
+        lines = [f"build: {self.wall:.3f} sec wall, {self.cpu:.3f} sec cpu"]
+        lines.append("stages:")
+        for name, stage in sorted(self.stages.items(), key=lambda s: -s[1]["wall"]):
+            lines.append(f"  {name:20} {stage['wall']:9.3f} sec {stage['count']:8d}x")
+        if self.counters:
+            lines.append("counters:")
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"  {name:20} {value:12d}")
+        if self.pages:
+            lines.append("slowest pages:")
+            for page in self.slowest_pages(top):
+                lines.append(f"  {page['wall']:9.3f} sec {page['page']}")
+        return "\n".join(lines)
+
+    def _stack(self) -> List[list]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _current_page(self) -> Optional[str]:
+        return getattr(self._local, "page", None)
+
+    def _add_stage(self, name: str, count: int, wall: float, cpu: float, page: Optional[str] = None):
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = {"count": 0, "wall": 0., "cpu": 0.}
+            stage["count"] += count
+            stage["wall"] += wall
+            stage["cpu"] += cpu
+            if page is not None:
+                p = self.pages.setdefault(page, {"wall": 0., "cpu": 0., "stages": dict()})
+                p["stages"][name] = p["stages"].get(name, 0.) + wall
+
+
+def active() -> Optional[BuildStats]:
+    """
+    The currently collecting BuildStats, or None.
+
+    A BuildStats is only active in the process that entered it,
+    not in forked worker processes.
+    """
+    if _active is None or _active._pid != os.getpid():
+        return None
+    return _active
+
+
+def stage(name: str):
+    """
+    Context manager that times a stage in the active BuildStats, if any
+    """
+    if _active is None:
+        return _NULL_CONTEXT
+    stats = active()
+    return stats.stage(name) if stats is not None else _NULL_CONTEXT
+
+
+def page(name: str):
+    """
+    Context manager that attributes stages to a page in the active BuildStats, if any
+    """
+    if _active is None:
+        return _NULL_CONTEXT
+    stats = active()
+    return stats.page(name) if stats is not None else _NULL_CONTEXT
+
+
+def count(name: str, value: int = 1):
+    if _active is not None:
+        stats = active()
+        if stats is not None:
+            stats.count(name, value)
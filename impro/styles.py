@@ -0,0 +1,215 @@
+import os
+import posixpath
+import re
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from . import stats
+from .util import hash_data, hash_file, stat_cached
+
+
+SCSS_IMPORT_PATTERN = re.compile(r"@import\s+([^;{}]+);")
+
+CSS_URL_PATTERN = re.compile(r"""url\(\s*(["']?)([^"')]+)\1\s*\)""")
+
+# file -> (``styles_key`` of the file, compiled css), see ``compile_styles``
+_compiled: Dict[Path, Tuple[str, str]] = dict()
+
+# file -> ((mtime, size), content hash / imported names), see ``util.stat_cached``
+_source_hashes: Dict[Path, tuple] = dict()
+_import_names: Dict[Path, tuple] = dict()
+
+
+def scss_imports(filename: Union[str, Path]) -> List[Path]:
+    """
+    Return all files that a scss file imports, recursively.
+
+    Imports of plain css, urls and files that can not be found are ignored,
+    they are resolved relative to the importing file.
+    """
+    imports = []
+    handled = {Path(filename).resolve()}
+    todo = [Path(filename)]
+    while todo:
+        filename = todo.pop()
+        for name in stat_cached(_import_names, filename, _read_import_names):
+            import_file = _find_import(filename.parent, name)
+            if import_file is not None and import_file.resolve() not in handled:
+                handled.add(import_file.resolve())
+                imports.append(import_file)
+                todo.append(import_file)
+    return imports
+
+
+def compile_scss(filename: Union[str, Path], minify: bool = False) -> str:
+    """
+    Compile a scss file with pyScss
+    """
+    try:
+        from scss import Compiler
+    except ImportError as e:
+        raise ImportError(f"pyScss is required to compile '{filename}'") from e
+    except Exception as e:
+        # e.g. pyScss 1.4 raises re.error on python 3.11
+        raise ImportError(
+            f"pyScss is not compatible with python {sys.version.split()[0]}, can not compile '{filename}'"
+            f": {type(e).__name__}: {e}"
+        ) from e
+
+    filename = Path(filename)
+    compiler = Compiler(
+        root=filename.parent,
+        search_path=[filename.parent],
+        output_style="compressed" if minify else "nested",
+    )
+    return compiler.compile_string(filename.read_text())
+
+
+def minify_css(css: str) -> str:
+    """
+    Remove comments and unnecessary whitespace from css
+    """
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.DOTALL)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    css = css.replace(";}", "}")
+    return css.strip() + "\n"
+
+
+def style_sources(files: List[Path]) -> List[Path]:
+    """
+    The files and the scss imports of all files, i.e. everything their compiled css depends on.
+
+    Missing files are included, their imports are not.
+    """
+    sources = []
+    for filename in files:
+        sources.append(filename)
+        if filename.suffix.lower() in (".scss", ".sass") and filename.exists():
+            sources.extend(scss_imports(filename))
+    return sources
+
+
+def styles_key(files: List[Path], minify: bool = False) -> str:
+    """
+    Hash of the contents of the files and all their scss imports.
+
+    The content hashes are kept until a file's modification time or size changes.
+    """
+    data = [minify]
+    for filename in style_sources(files):
+        data.extend([str(filename), stat_cached(_source_hashes, filename, hash_file)])
+    return hash_data(*data)
+
+
+def rebase_urls(css: str, base: str) -> str:
+    """
+    Replace relative ``url(...)`` references by absolute url paths.
+
+    :param css: the stylesheet
+    :param base: str, the url path of the directory the stylesheet was written for, e.g. "/docs/css"
+    """
+    def _rebase(match: re.Match) -> str:
+        quote, url = match.group(1), match.group(2).strip()
+        if url.startswith(("/", "#")) or "//" in url or re.match(r"[A-Za-z][A-Za-z0-9+.-]*:", url):
+            return match.group(0)
+
+        path, suffix = re.match(r"([^?#]*)(.*)", url).groups()
+        path = posixpath.normpath(posixpath.join("/", base, path))
+        return f"url({quote}{path}{suffix}{quote})"
+
+    return CSS_URL_PATTERN.sub(_rebase, css)
+
+
+def compile_styles(files: List[Path], minify: bool = False, bases: Optional[List[str]] = None) -> str:
+    """
+    Compile scss files, optionally minify, and concatenate the css of all files.
+
+    Compiled files are kept until one of the files or their imports change.
+
+    :param bases: optional list of the url path of the directory of each file,
+        relative urls of the files are rebased, see ``rebase_urls``
+    """
+    css = []
+    for i, filename in enumerate(files):
+        key = styles_key([filename], minify)
+        entry = _compiled.get(filename)
+        if entry is None or entry[0] != key:
+            with stats.stage("styles"):
+                if filename.suffix.lower() in (".scss", ".sass"):
+                    compiled = compile_scss(filename, minify=minify)
+                else:
+                    compiled = filename.read_text()
+                if minify:
+                    compiled = minify_css(compiled)
+            entry = _compiled[filename] = (key, compiled)
+
+        compiled = entry[1]
+        if bases is not None:
+            compiled = rebase_urls(compiled, bases[i])
+        css.append(compiled if compiled.endswith("\n") else compiled + "\n")
+
+    return "".join(css)
+
+
+def bundle_styles(
+        files: List[Path],
+        path: Union[str, Path],
+        minify: bool = False,
+        bases: Optional[List[str]] = None,
+) -> Path:
+    """
+    Write the compiled css of all files into one bundle file in directory ``path``.
+
+    The bundle is named after the hash of all inputs, so pages with the same
+    stylesheets share a bundle, and an existing bundle is not compiled again.
+
+    :param bases: optional list of the url path of the directory of each file,
+        relative urls of the files are rebased, see ``rebase_urls``
+    :return: Path of the bundle file
+    """
+    filename = Path(path) / (hash_data(styles_key(files, minify), bases)[:16] + ".css")
+    if filename.exists():
+        stats.count("style_bundle_hits")
+        return filename
+
+    css = compile_styles(files, minify=minify, bases=bases)
+
+    os.makedirs(filename.parent, exist_ok=True)
+    temp_name = filename.with_name(f".{filename.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+    try:
+        temp_name.write_text(css)
+        os.replace(temp_name, filename)
+    except BaseException:
+        if temp_name.exists():
+            temp_name.unlink()
+        raise
+
+    return filename
+
+
+def _read_import_names(filename: Path) -> Tuple[str, ...]:
+    names = []
+    for match in SCSS_IMPORT_PATTERN.finditer(filename.read_text()):
+        for name in match.group(1).split(","):
+            name = name.strip().strip("\"'")
+            if name and not name.startswith("url(") and "//" not in name and not name.endswith(".css"):
+                names.append(name)
+    return tuple(names)
+
+
+def _find_import(path: Path, name: str) -> Optional[Path]:
+    name_path = Path(name)
+    candidates = [name_path]
+    if not name_path.suffix:
+        candidates = [
+            name_path.with_name(prefix + name_path.name + suffix)
+            for suffix in (".scss", ".sass")
+            for prefix in ("", "_")
+        ]
+    for candidate in candidates:
+        if (path / candidate).is_file():
+            return path / candidate
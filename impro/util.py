@@ -1,7 +1,9 @@
+import hashlib
+import json
 import os
 import urllib.parse
 from pathlib import Path
-from typing import Union
+from typing import Any, Callable, Union
 
 
 def sluggify(s: str) -> str:
@@ -39,3 +41,45 @@ def join_path(*paths: Union[str, Path]) -> str:
 
 def relative_path(path: Union[str, Path], root: Union[str, Path]) -> str:
     return os.path.relpath(str(path), str(root))
+
+
+def hash_data(*data) -> str:
+    """
+    Return a hex digest of all arguments.
+
+    str and bytes are hashed as-is, everything else is hashed by it's json representation.
+    """
+    h = hashlib.sha256()
+    for d in data:
+        if isinstance(d, str):
+            d = d.encode("utf-8")
+        elif not isinstance(d, bytes):
+            d = json.dumps(d, sort_keys=True, default=str).encode("utf-8")
+        h.update(len(d).to_bytes(8, "little"))
+        h.update(d)
+    return h.hexdigest()
+
+
+def hash_file(path: Union[str, Path], chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fp:
+        while True:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def stat_cached(cache: dict, path: Path, func: Callable[[Path], Any]) -> Any:
+    """
+    Return ``func(path)``, stored in ``cache`` under ``path`` until the
+    modification time or size of the file changes.
+
+    The cache holds one entry per file, so it does not grow when files are edited.
+    """
+    stat = os.stat(path)
+    entry = cache.get(path)
+    if entry is None or entry[0] != (stat.st_mtime_ns, stat.st_size):
+        entry = cache[path] = ((stat.st_mtime_ns, stat.st_size), func(path))
+    return entry[1]
@@ -0,0 +1,186 @@
+import os
+import time
+import traceback
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .files import SourceFile
+from .site import Site
+from .writer import Writer
+
+
+class FileWatcher:
+    """
+    Polls the modification times of a set of files.
+    """
+    def __init__(self, interval: float = .5):
+        self.interval = interval
+        self._mtimes: Dict[Path, Optional[int]] = dict()
+
+    @property
+    def files(self) -> List[Path]:
+        return list(self._mtimes)
+
+    def set_files(self, files: Iterable[Path]):
+        """
+        Replace the watched files, files that have been watched before keep their state
+        """
+        self._mtimes = {
+            file: self._mtimes[file] if file in self._mtimes else _mtime(file)
+            for file in files
+        }
+
+    def poll(self) -> Set[Path]:
+        """
+        Return the files that have been modified, created or deleted since the last poll
+        """
+        changed = set()
+        for file, mtime in self._mtimes.items():
+            new_mtime = _mtime(file)
+            if new_mtime != mtime:
+                self._mtimes[file] = new_mtime
+                changed.add(file)
+        return changed
+
+    def wait(self) -> Set[Path]:
+        """
+        Block until at least one file changed
+        """
+        while True:
+            changed = self.poll()
+            if changed:
+                return changed
+            time.sleep(self.interval)
+
+
+class SiteWatcher:
+    """
+    Watches the files, templates, bundled stylesheets and optionally the associated files
+    of all pages of a Site and maps changes to the affected pages.
+
+    :param site: the Site
+    :param format: str, the output format, which determines the layout templates
+    :param associated_files: bool, also watch the associated files, e.g. images
+    :param interval: float, seconds between polls
+    """
+    def __init__(
+            self,
+            site: Site,
+            format: str,
+            associated_files: bool = False,
+            interval: float = .5,
+    ):
+        self.site = site
+        self.format = format
+        self.associated_files = associated_files
+        self.watcher = FileWatcher(interval=interval)
+        # watched file -> page keys
+        self._page_keys: Dict[Path, Set[str]] = dict()
+        # watched associated file -> export paths
+        self._export_paths: Dict[Path, Set[str]] = dict()
+        self.update()
+
+    def update(self):
+        """
+        Re-read the dependencies of all pages
+        """
+        page_keys = dict()
+        for key in self.site.page_keys():
+            page = self.site.get_page(key)
+            files = page.template_files(self.format)
+            if page.markup.filename:
+                files.append(page.markup.filename)
+            # the bundle of the page changes with it's stylesheets
+            files.extend(self.site.style_sources(key, self.format))
+            for file in files:
+                page_keys.setdefault(file.resolve(), set()).add(key)
+
+        export_paths = dict()
+        if self.associated_files:
+            for export_path, real_path in self.site.associated_file_routes(self.format).items():
+                export_paths.setdefault(real_path.resolve(), set()).add(export_path)
+
+        self._page_keys = page_keys
+        self._export_paths = export_paths
+        self.watcher.set_files(list(page_keys) + list(export_paths))
+
+    def wait(self) -> Set[Path]:
+        """
+        Block until at least one watched file changed
+        """
+        return self.watcher.wait()
+
+    def apply(self, changed: Set[Path]) -> Tuple[List[str], List[Tuple[str, Path]]]:
+        """
+        Reload the pages whose files changed and clear the rendered data
+        of pages whose templates changed.
+
+        :param changed: set of changed files, as returned by ``wait``
+        :return: tuple of
+            - list of keys of the pages that need to be rendered again
+            - list of (export path, source file) of changed associated files
+        """
+        # created or deleted files can change which templates are found
+        self.site.clear_file_cache()
+
+        affected_keys = set()
+        for file in changed:
+            affected_keys.update(self._page_keys.get(file, ()))
+
+        keys = []
+        for key in self.site.page_keys():
+            if key in affected_keys:
+                page = self.site.get_page(key)
+                if page.markup.filename and page.markup.filename.resolve() in changed:
+                    key = self.site.reload_page(key)
+                else:
+                    page.clear_cache()
+                keys.append(key)
+
+        files = [
+            (export_path, file)
+            for file in changed
+            for export_path in sorted(self._export_paths.get(file, ()))
+        ]
+
+        self.update()
+        return keys, files
+
+
+def watch_and_write(site: Site, format: str, writer: Writer, interval: float = .5):
+    """
+    Write the output of every page again when it's file or templates change,
+    and copy changed associated files.
+
+    The writer is closed after each round, e.g. so a ``SyncFileWriter``
+    lists the written files. It must accept writes after ``close``.
+
+    Runs until interrupted.
+    """
+    watcher = SiteWatcher(site, format, associated_files=True, interval=interval)
+    print(f"Watching {len(watcher.watcher.files)} files")
+    while True:
+        changed = watcher.wait()
+        try:
+            keys, files = watcher.apply(changed)
+            for key in keys:
+                rendered = site.render_page(key, format)
+                writer.write(rendered["filename"], rendered["content"])
+                for file in rendered["files"]:
+                    files.append((file["export_path"], file["real_path"]))
+
+            for export_path, real_path in dict(files).items():
+                writer.write(export_path, SourceFile(real_path))
+            writer.close()
+
+            print(f"Rendered {len(keys)} page(s), copied {len(dict(files))} file(s)")
+
+        except Exception:
+            traceback.print_exc()
+
+
+def _mtime(file: Path) -> Optional[int]:
+    try:
+        return os.stat(file).st_mtime_ns
+    except OSError:
+        return None
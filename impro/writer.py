@@ -1,10 +1,30 @@
+import hashlib
+import io
+import json
 import os
+import queue
+import shutil
+import tarfile
+import threading
+import time
+import zipfile
 from pathlib import Path
-from typing import List, Tuple, Dict, Union, Optional
+from typing import List, Tuple, Dict, Union, Optional, Set, BinaryIO
+
+from .compress import is_compressible
+from .excpetions import WriteError
+from .files import SourceFile, copy_file, COPY_MODES
+from .util import hash_file
+
+
+Content = Union[str, bytes, SourceFile]
 
 
 class Writer:
 
+    # True if ``write`` can be called from several threads at once
+    thread_safe = False
+
     def __init__(self, root: Union[str, Path]):
         self.root = Path(root)
         if not self.root.is_absolute():
@@ -12,41 +32,203 @@ class Writer:
                 f"Absolute dir required for {self.__class__.__name__} root, got '{self.root}'"
             )
 
-    def write(self, filename: Union[str, Path], content: Union[str, bytes]):
+    def write(self, filename: Union[str, Path], content: Content):
         self._check_filename_and_content(filename, content)
         raise NotImplementedError
 
+    def remove(self, filename: Union[str, Path]):
+        """
+        Remove a previously written file
+        """
+        raise NotImplementedError
+
+    def keep(self, filename: Union[str, Path]):
+        """
+        Mark a file from a previous run as still being part of the output
+        """
+        pass
+
+    def flush(self):
+        """
+        Block until all files passed to ``write`` are written
+        """
+        pass
+
+    def close(self):
+        """
+        Called after all files have been written
+        """
+        pass
+
+    def abort(self):
+        """
+        Called instead of ``close`` when writing the files failed
+        """
+        pass
+
     def full_filename(self, filename: Union[str, Path]) -> Path:
         filename = str(filename).lstrip("/")
         return self.root / filename
 
-    def _check_filename_and_content(self, filename: Union[str, Path], content: Union[str, bytes]):
-        if not isinstance(content, (str, bytes)):
+    def _check_filename_and_content(self, filename: Union[str, Path], content: Content):
+        if not isinstance(content, (str, bytes, SourceFile)):
             raise TypeError(
-                f"{self.__class__.__name__} expected str or bytes, got '{type(content).__name__}' for '{filename}'"
+                f"{self.__class__.__name__} expected str, bytes or SourceFile, got '{type(content).__name__}' for '{filename}'"
             )
 
 
 class FileWriter(Writer):
+    """
+    Writes files to the filesystem.
 
-    def __init__(self, root: Union[str, Path]):
+    :param root: absolute output directory
+    :param copy_mode: str, how SourceFile contents are copied, see ``files.copy_file``
+    """
+    thread_safe = True
+
+    def __init__(self, root: Union[str, Path], copy_mode: str = "copy"):
         super().__init__(root)
+        if copy_mode not in COPY_MODES:
+            raise ValueError(f"Invalid copy_mode '{copy_mode}', expected one of {COPY_MODES}")
+        self.copy_mode = copy_mode
         self.files: List[Path] = []
+        self._created_paths: Set[Path] = set()
 
-    def write(self, filename: Union[str, Path], content: Union[str, bytes]):
+    def write(self, filename: Union[str, Path], content: Content):
         self._check_filename_and_content(filename, content)
 
         full_name = self.full_filename(filename)
-        full_path = full_name.parent
-        os.makedirs(full_path, exist_ok=True)
+        self._makedirs(full_name.parent)
 
         if isinstance(content, str):
             full_name.write_text(content)
+        elif isinstance(content, SourceFile):
+            copy_file(content.path, full_name, mode=self.copy_mode)
         else:
             full_name.write_bytes(content)
 
         self.files.append(full_name)
 
+    def remove(self, filename: Union[str, Path]):
+        full_name = self.full_filename(filename)
+        if full_name.exists():
+            full_name.unlink()
+
+    def _makedirs(self, path: Path):
+        if path not in self._created_paths:
+            os.makedirs(path, exist_ok=True)
+            self._created_paths.add(path)
+
+
+class SyncFileWriter(FileWriter):
+    """
+    A FileWriter that only replaces files whose content changed.
+
+    Changed files are written to a temporary file and atomically moved into place.
+    The written and kept files are listed in ``FILE_LIST`` below ``root``.
+    When closed, the files of the previous list that have not been written
+    or kept during this run are deleted, unless ``prune`` is False.
+    Other files below ``root`` are never deleted.
+    """
+
+    FILE_LIST = ".impro-files.json"
+
+    def __init__(self, root: Union[str, Path], copy_mode: str = "copy", prune: bool = True):
+        super().__init__(root, copy_mode=copy_mode)
+        self.prune = prune
+        self.unchanged: List[Path] = []
+        self.deleted: List[Path] = []
+        self._kept: Set[Path] = set()
+
+    def write(self, filename: Union[str, Path], content: Content):
+        self._check_filename_and_content(filename, content)
+
+        full_name = self.full_filename(filename)
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+
+        if self._is_identical(full_name, content):
+            self.unchanged.append(full_name)
+            return
+
+        self._makedirs(full_name.parent)
+        temp_name = full_name.with_name(f".{full_name.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+        try:
+            if isinstance(content, SourceFile):
+                copy_file(content.path, temp_name, mode=self.copy_mode)
+            else:
+                temp_name.write_bytes(content)
+            os.replace(temp_name, full_name)
+        except BaseException:
+            if temp_name.exists():
+                temp_name.unlink()
+            raise
+
+        self.files.append(full_name)
+
+    def keep(self, filename: Union[str, Path]):
+        self._kept.add(self.full_filename(filename))
+
+    def close(self):
+        if not self.root.exists():
+            return
+
+        produced = self._kept.union(self.files, self.unchanged)
+        if self.prune:
+            for full_name in sorted(self._previous_files() - produced):
+                if full_name.is_file():
+                    full_name.unlink()
+                    self.deleted.append(full_name)
+                self._remove_empty_dirs(full_name.parent)
+
+        self._write_file_list(produced)
+
+    def abort(self):
+        # nothing is pruned, the files of the previous run stay listed
+        if self.root.exists():
+            self._write_file_list(self._kept.union(self.files, self.unchanged, self._previous_files()))
+
+    def _write_file_list(self, files: Set[Path]):
+        list_filename = self.root / self.FILE_LIST
+        list_filename.write_text(json.dumps(
+            sorted(str(f.relative_to(self.root)) for f in files if f != list_filename),
+            indent=1,
+        ))
+
+    def _previous_files(self) -> Set[Path]:
+        try:
+            names = json.loads((self.root / self.FILE_LIST).read_text())
+        except (IOError, ValueError):
+            return set()
+
+        files = set()
+        for name in names if isinstance(names, list) else []:
+            full_name = self.full_filename(name)
+            # ignore entries that point outside of root
+            if os.path.normpath(full_name).startswith(os.path.join(os.path.normpath(self.root), "")):
+                files.add(full_name)
+        return files
+
+    def _remove_empty_dirs(self, path: Path):
+        while path != self.root and self.root in path.parents:
+            try:
+                path.rmdir()
+            except OSError:
+                return
+            path = path.parent
+
+    def _is_identical(self, full_name: Path, content: Union[bytes, SourceFile]) -> bool:
+        try:
+            if full_name.stat().st_size != len(content):
+                return False
+            if isinstance(content, SourceFile):
+                if os.path.samefile(content.path, full_name):
+                    return True
+                return hash_file(full_name) == hash_file(content.path)
+            return hash_file(full_name) == hashlib.sha256(content).hexdigest()
+        except FileNotFoundError:
+            return False
+
 
 class MemoryWriter(FileWriter):
 
@@ -54,8 +236,317 @@ class MemoryWriter(FileWriter):
         super().__init__(root=root)
         self.files: Dict[Path, Union[str, bytes]] = dict()
 
-    def write(self, filename: Union[str, Path], content: Union[str, bytes]):
+    def write(self, filename: Union[str, Path], content: Content):
         self._check_filename_and_content(filename, content)
 
         full_name = self.full_filename(filename)
+        if isinstance(content, SourceFile):
+            content = content.read()
         self.files[full_name] = content
+
+    def remove(self, filename: Union[str, Path]):
+        self.files.pop(self.full_filename(filename), None)
+
+
+class BackgroundWriter(Writer):
+    """
+    Wraps another writer and writes files in background threads,
+    so the caller can render the next file in the meantime.
+
+    ``write`` blocks while more than ``max_bytes`` of content is queued or being written.
+    Errors are collected and raised as ``WriteError`` by ``flush`` and ``close``,
+    in which case ``close`` aborts the wrapped writer instead of closing it.
+    Attributes that are not defined here are read from the wrapped writer.
+
+    :param writer: the Writer that writes the files
+    :param workers: int, number of threads, 1 if the writer is not ``thread_safe``
+    :param max_bytes: int, maximum size of the str or bytes contents in flight,
+        str contents are counted by their utf-8 encoded size, SourceFile contents are not counted
+    """
+    def __init__(self, writer: Writer, workers: int = 4, max_bytes: int = 64 * 1024 * 1024):
+        super().__init__(writer.root)
+        self.writer = writer
+        self.workers = max(1, workers) if writer.thread_safe else 1
+        self.max_bytes = max_bytes
+        self._queue = queue.Queue()
+        self._condition = threading.Condition()
+        self._bytes_in_flight = 0
+        self._errors: List[Tuple[str, BaseException]] = []
+        self._threads: List[threading.Thread] = []
+
+    def __getattr__(self, name: str):
+        # only called for attributes that are not found on the instance
+        if name == "writer":
+            raise AttributeError(name)
+        return getattr(self.writer, name)
+
+    def write(self, filename: Union[str, Path], content: Content):
+        self._check_filename_and_content(filename, content)
+
+        size = _content_size(content)
+        with self._condition:
+            while self._bytes_in_flight and self._bytes_in_flight + size > self.max_bytes:
+                self._condition.wait()
+            self._bytes_in_flight += size
+
+        if len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        self._queue.put((filename, content, size))
+
+    def remove(self, filename: Union[str, Path]):
+        self.flush()
+        self.writer.remove(filename)
+
+    def keep(self, filename: Union[str, Path]):
+        self.writer.keep(filename)
+
+    def flush(self):
+        self._queue.join()
+        self._raise_errors()
+
+    def close(self):
+        self._stop_threads()
+        if self._errors:
+            # e.g. removes a partial archive, or skips pruning of a SyncFileWriter
+            try:
+                self.writer.abort()
+            finally:
+                self._raise_errors()
+        self.writer.close()
+
+    def abort(self):
+        self._stop_threads()
+        self._errors = []
+        self.writer.abort()
+
+    def full_filename(self, filename: Union[str, Path]) -> Path:
+        return self.writer.full_filename(filename)
+
+    def _stop_threads(self):
+        self._queue.join()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _raise_errors(self):
+        if self._errors:
+            errors, self._errors = self._errors, []
+            raise WriteError(errors) from errors[0][1]
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+
+                filename, content, size = item
+                try:
+                    self.writer.write(filename, content)
+                except Exception as e:
+                    with self._condition:
+                        self._errors.append((str(filename), e))
+                finally:
+                    with self._condition:
+                        self._bytes_in_flight -= size
+                        self._condition.notify_all()
+            finally:
+                self._queue.task_done()
+
+
+class ArchiveWriter(Writer):
+    """
+    Base class of writers that stream all files into one archive.
+
+    Files are added in the order they are written, ``close`` finishes the archive.
+    Files can not be removed.
+
+    An archive file is written to a temporary file next to it and only
+    moved into place by ``close``, ``abort`` deletes the temporary file.
+
+    :param file: filename or binary stream of the archive, e.g. ``sys.stdout.buffer``
+    :param mtime: optional modification timestamp of all entries, defaults to now
+    """
+    def __init__(self, file: Union[str, Path, BinaryIO], mtime: Optional[float] = None):
+        super().__init__(root="/")
+        self.file = file
+        self.mtime = time.time() if mtime is None else mtime
+        self.files: List[str] = []
+        # the file or stream that the archive is written to
+        self._target = file
+        if not hasattr(file, "write"):
+            file = Path(file)
+            self._target = file.with_name(f".{file.name}.{os.getpid()}.tmp")
+
+    def close(self):
+        if self._target is self.file:
+            self._close_archive()
+            return
+        try:
+            self._close_archive()
+            os.replace(self._target, self.file)
+        except BaseException:
+            if os.path.exists(self._target):
+                os.unlink(self._target)
+            raise
+
+    def abort(self):
+        # a partial archive in a stream is left unfinished, so it can not be mistaken for a valid one
+        if self._target is self.file:
+            return
+        try:
+            self._close_archive()
+        finally:
+            if os.path.exists(self._target):
+                os.unlink(self._target)
+
+    def write(self, filename: Union[str, Path], content: Content):
+        self._check_filename_and_content(filename, content)
+
+        name = self.entry_name(filename)
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        self._add(name, content)
+        self.files.append(name)
+
+    def remove(self, filename: Union[str, Path]):
+        raise NotImplementedError(f"{self.__class__.__name__} can not remove files")
+
+    def entry_name(self, filename: Union[str, Path]) -> str:
+        return str(filename).lstrip("/")
+
+    def _add(self, name: str, content: Union[bytes, SourceFile]):
+        raise NotImplementedError
+
+    def _close_archive(self):
+        raise NotImplementedError
+
+
+class ZipWriter(ArchiveWriter):
+    """
+    Writes all files into a zip archive.
+
+    Compressible files are deflated, others, like images, are stored.
+    """
+    def __init__(
+            self,
+            file: Union[str, Path, BinaryIO],
+            mtime: Optional[float] = None,
+            compress: bool = True,
+    ):
+        super().__init__(file, mtime=mtime)
+        self.compress = compress
+        self._zip = zipfile.ZipFile(self._target, "w")
+        # zip timestamps start in 1980
+        self._date_time = max(time.localtime(self.mtime)[:6], (1980, 1, 1, 0, 0, 0))
+
+    def _close_archive(self):
+        self._zip.close()
+
+    def _add(self, name: str, content: Union[bytes, SourceFile]):
+        info = zipfile.ZipInfo(name, date_time=self._date_time)
+        info.external_attr = 0o644 << 16
+        if self.compress and is_compressible(name):
+            info.compress_type = zipfile.ZIP_DEFLATED
+
+        if isinstance(content, SourceFile):
+            info.file_size = content.size
+            force_zip64 = info.file_size >= zipfile.ZIP64_LIMIT
+            with content.open() as fsrc, self._zip.open(info, "w", force_zip64=force_zip64) as fdst:
+                shutil.copyfileobj(fsrc, fdst, 1 << 20)
+        else:
+            self._zip.writestr(info, content)
+
+
+class TarWriter(ArchiveWriter):
+    """
+    Writes all files into a tar archive.
+
+    The archive is written as a stream, so ``file`` does not need to be seekable.
+
+    :param compression: optional str, "gz", "bz2" or "xz"
+    """
+    def __init__(
+            self,
+            file: Union[str, Path, BinaryIO],
+            mtime: Optional[float] = None,
+            compression: Optional[str] = None,
+    ):
+        super().__init__(file, mtime=mtime)
+        self.compression = compression
+        mode = f"w|{compression or ''}"
+        if hasattr(file, "write"):
+            self._tar = tarfile.open(fileobj=file, mode=mode)
+        else:
+            self._tar = tarfile.open(name=str(self._target), mode=mode)
+
+    def _close_archive(self):
+        self._tar.close()
+
+    def _add(self, name: str, content: Union[bytes, SourceFile]):
+        info = tarfile.TarInfo(name)
+        info.mtime = int(self.mtime)
+        info.mode = 0o644
+        if isinstance(content, SourceFile):
+            info.size = content.size
+            with content.open() as fp:
+                self._tar.addfile(info, fp)
+        else:
+            info.size = len(content)
+            self._tar.addfile(info, io.BytesIO(content))
+
+
+# archive format -> (writer class, keyword arguments)
+ARCHIVE_FORMATS = {
+    "zip": (ZipWriter, {}),
+    "tar": (TarWriter, {}),
+    "tar.gz": (TarWriter, {"compression": "gz"}),
+    "tgz": (TarWriter, {"compression": "gz"}),
+    "tar.bz2": (TarWriter, {"compression": "bz2"}),
+    "tar.xz": (TarWriter, {"compression": "xz"}),
+}
+
+
+def archive_format(filename: Union[str, Path]) -> Optional[str]:
+    """
+    Return the archive format of a filename, e.g. "tar.gz" for "site.tar.gz", or None
+    """
+    filename = str(filename).lower()
+    for format in sorted(ARCHIVE_FORMATS, key=len, reverse=True):
+        if filename.endswith("." + format):
+            return format
+
+
+def archive_writer(
+        file: Union[str, Path, BinaryIO],
+        format: Optional[str] = None,
+        mtime: Optional[float] = None,
+) -> ArchiveWriter:
+    """
+    Create the ArchiveWriter for a format.
+
+    :param file: filename or binary stream
+    :param format: optional str, one of ``ARCHIVE_FORMATS``, guessed from the filename if omitted
+    """
+    if format is None:
+        format = archive_format(file) if not hasattr(file, "write") else None
+        if format is None:
+            raise ValueError(f"Can not guess the archive format of '{file}'")
+    if format not in ARCHIVE_FORMATS:
+        raise ValueError(f"Invalid archive format '{format}', expected one of {tuple(ARCHIVE_FORMATS)}")
+
+    writer_class, kwargs = ARCHIVE_FORMATS[format]
+    return writer_class(file, mtime=mtime, **kwargs)
+
+
+def _content_size(content: Content) -> int:
+    if isinstance(content, SourceFile):
+        return 0
+    if isinstance(content, str) and not content.isascii():
+        return len(content.encode("utf-8"))
+    return len(content)
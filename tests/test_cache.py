@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from impro.cache import RenderCache
+from impro.environment import Environment
+from impro.pages import Page
+from impro.site import Site
+from impro.stats import BuildStats
+from impro.writer import MemoryWriter
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+
+
+class TestRenderCache(unittest.TestCase):
+
+    def test_get_set_evict(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = RenderCache(tmp)
+            self.assertIsNone(cache.get("abcdef"))
+
+            cache.set("abcdef", "first")
+            cache.set("012345", "second ü")
+            self.assertEqual("first", cache.get("abcdef"))
+            self.assertEqual("second ü", cache.get("012345"))
+            self.assertTrue((Path(tmp) / "ab" / "cdef").exists())
+            self.assertEqual(5 + 9, cache.size())
+
+            os.utime(cache.filename("abcdef"), ns=(0, 0))
+            self.assertEqual(1, cache.evict(10))
+            self.assertIsNone(cache.get("abcdef"))
+            self.assertEqual("second ü", cache.get("012345"))
+
+            cache.clear()
+            self.assertEqual([], cache.entries())
+
+    def test_site(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source_dir = Path(tmp) / "source"
+            shutil.copytree(DATA_DIR, source_dir)
+            env = Environment(cache_path=Path(tmp) / "cache")
+
+            def _build():
+                site = Site()
+                site.add_page(
+                    Page.from_file(source_dir / "sub_fm.md", env=env),
+                    Page.from_file(source_dir / "with_css.md", env=env),
+                )
+                with BuildStats() as build_stats:
+                    writer = site.write_files("/", "html", writer=MemoryWriter)
+                return writer.files, build_stats
+
+            files, build_stats = _build()
+            self.assertNotIn("render_cache_hits", build_stats.counters)
+
+            cached_files, build_stats = _build()
+            self.assertEqual(files, cached_files)
+            self.assertEqual(4, build_stats.counters["render_cache_hits"])
+            self.assertNotIn("markdown_parse", build_stats.stages)
+
+            # changing an extended template
+            base = source_dir / "base.md"
+            base.write_text(base.read_text().replace("{% block content %}", "changed {% block content %}"))
+            changed_files, build_stats = _build()
+            self.assertIn("changed", changed_files[Path("/sub-fm.html")])
+            self.assertEqual(files[Path("/with-css.html")], changed_files[Path("/with-css.html")])
+
+    def test_layout_context(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp)
+            (path / "layout.html").write_text("<title>{{html.title}}</title>{{slug}}{{html.body}}")
+            for name in ("a.md", "b.md"):
+                (path / name).write_text("---\nlayout: layout.html\n---\n# Same\n")
+            env = Environment(search_paths=[path], cache_path=path / "cache")
+
+            for i in range(2):
+                site = Site()
+                site.add_page(*(Page.from_file(path / name, env=env) for name in ("a.md", "b.md")))
+                files = site.write_files("/", "html", writer=MemoryWriter).files
+                self.assertIn("</title>a<h1>", files[Path("/a.html")])
+                self.assertIn("</title>b<h1>", files[Path("/b.html")])
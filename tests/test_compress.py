@@ -0,0 +1,92 @@
+import gzip
+import http.client
+import os
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from impro.compress import accepts_gzip, compress_files
+from impro.pages import Page
+from impro.server import SiteServer
+from impro.site import Site
+from impro.writer import SyncFileWriter
+
+
+class TestCompress(unittest.TestCase):
+
+    def test_accepts_gzip(self):
+        self.assertTrue(accepts_gzip("gzip, deflate, br"))
+        self.assertTrue(accepts_gzip("br;q=1.0, gzip;q=0.8"))
+        self.assertTrue(accepts_gzip("*"))
+        self.assertFalse(accepts_gzip("gzip;q=0"))
+        self.assertFalse(accepts_gzip("gzip;q=0, *"))
+        self.assertFalse(accepts_gzip("*, gzip; q=0.0"))
+        self.assertFalse(accepts_gzip("*;q=0"))
+        self.assertTrue(accepts_gzip("gzip;q=0.5, *;q=0"))
+        self.assertTrue(accepts_gzip("deflate, x-gzip"))
+        self.assertFalse(accepts_gzip("br"))
+        self.assertFalse(accepts_gzip(None))
+
+    def test_compress_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            (root / "big.html").write_text("<p>text</p>" * 1000)
+            (root / "small.html").write_text("<p>text</p>")
+            (root / "image.png").write_bytes(b"\x00" * 10000)
+
+            gz_files = compress_files([root / "big.html", root / "small.html", root / "image.png"])
+            self.assertEqual([root / "big.html.gz"], gz_files)
+            self.assertEqual(
+                (root / "big.html").read_bytes(),
+                gzip.decompress((root / "big.html.gz").read_bytes()),
+            )
+
+            # unchanged source is skipped
+            mtime = (root / "big.html.gz").stat().st_mtime_ns
+            os.utime(root / "big.html.gz", ns=(mtime, mtime))
+            (root / "big.html.gz").write_bytes(b"marker")
+            os.utime(root / "big.html.gz", ns=(mtime, mtime))
+            compress_files([root / "big.html"])
+            self.assertEqual(b"marker", (root / "big.html.gz").read_bytes())
+
+    def test_site_compress(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = Path(tmp) / "source"
+            source.mkdir()
+            (source / "page.md").write_text("# title\n\n" + "Some paragraph text.\n\n" * 200)
+            site = Site()
+            site.add_page(Page.from_file(source / "page.md"))
+
+            output = Path(tmp) / "output"
+            site.write_files(output, "html", writer=SyncFileWriter, compress=True)
+            self.assertEqual(
+                [SyncFileWriter.FILE_LIST, "page.html", "page.html.gz"],
+                sorted(os.listdir(output)),
+            )
+
+            # the sync writer keeps the compressed file
+            site.write_files(output, "html", writer=SyncFileWriter, compress=True)
+            self.assertEqual(
+                [SyncFileWriter.FILE_LIST, "page.html", "page.html.gz"],
+                sorted(os.listdir(output)),
+            )
+
+            server = SiteServer(("127.0.0.1", 0), site)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self.addCleanup(server.server_close)
+            self.addCleanup(server.shutdown)
+
+            connection = http.client.HTTPConnection("127.0.0.1", server.server_port)
+            connection.request("GET", "/page.html", headers={"Accept-Encoding": "gzip"})
+            response = connection.getresponse()
+            self.assertEqual("gzip", response.getheader("Content-Encoding"))
+            self.assertEqual("Accept-Encoding", response.getheader("Vary"))
+            self.assertEqual((output / "page.html").read_bytes(), gzip.decompress(response.read()))
+
+            connection.request("GET", "/page.html")
+            response = connection.getresponse()
+            self.assertIsNone(response.getheader("Content-Encoding"))
+            self.assertEqual("Accept-Encoding", response.getheader("Vary"))
+            self.assertEqual((output / "page.html").read_bytes(), response.read())
+            connection.close()
@@ -0,0 +1,58 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from impro import environment
+from impro.environment import Environment
+from impro.pages import Page
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+
+
+class TestEnvironment(unittest.TestCase):
+
+    def test_shared_jinja_env(self):
+        page1 = Page.from_file(DATA_DIR / "sub_fm.md")
+        page2 = Page.from_file(DATA_DIR / "sub_no_fm.md")
+        self.assertIsNot(page1.env, page2.env)
+        self.assertIs(page1.env.jinja_env(), page2.env.jinja_env())
+        self.assertIs(page1.env.jinja_env(), Environment([DATA_DIR]).jinja_env())
+        self.assertIsNot(page1.env.jinja_env(), Environment([DATA_DIR / "sub-path"]).jinja_env())
+
+        # only the most recently used jinja environments are kept
+        jinja_env = page1.env.jinja_env()
+        for i in range(environment.MAX_JINJA_ENVIRONMENTS):
+            Environment([DATA_DIR / f"other-{i}"]).jinja_env()
+        self.assertEqual(environment.MAX_JINJA_ENVIRONMENTS, len(environment._jinja_environments))
+        self.assertIs(jinja_env, page1.env.jinja_env())
+        self.assertIsNot(jinja_env, Environment([DATA_DIR]).jinja_env())
+
+    def test_bytecode_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = Environment(cache_path=tmp)
+            self.assertEqual(Path(tmp), env.copy().cache_path)
+
+            page = Page.from_file(DATA_DIR / "sub_fm.md", env=env)
+            page.to_md()
+            self.assertTrue(list((Path(tmp) / "jinja").iterdir()))
+
+    def test_find_file_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp)
+            (path / "sub").mkdir()
+            (path / "sub" / "a.html").write_text("a")
+            env = Environment([path])
+
+            self.assertEqual(path / "sub" / "a.html", env.find_file("sub/a.html"))
+            self.assertEqual(path / "sub/../sub/a.html", env.copy().find_file("sub/../sub/a.html"))
+            self.assertEqual(Environment.IMPRO_PATH / "templates" / "base.html", env.find_file("base.html"))
+            self.assertIsNone(env.find_file("b.html"))
+            self.assertIsNone(env.find_file("missing/b.html"))
+
+            # new files are found by other environments and after clearing the cache
+            (path / "b.html").write_text("b")
+            self.assertIsNone(env.find_file("b.html"))
+            self.assertIsNone(env.copy().find_file("b.html"))
+            self.assertEqual(path / "b.html", Environment([path]).find_file("b.html"))
+            env.copy().clear_file_cache()
+            self.assertEqual(path / "b.html", env.find_file("b.html"))
@@ -1,8 +1,13 @@
 import unittest
+from io import StringIO
+from pathlib import Path
 
-from impro.pages.frontmatter import split_front_matter_and_markup
+from impro.pages.frontmatter import split_front_matter_and_markup, read_front_matter, strip_front_matter_lines
+from impro.pages.markup import Markup
 from impro.excpetions import FrontMatterError
 
+DATA_PATH = Path(__file__).resolve().parent / "data"
+
 
 class TestFrontmatter(unittest.TestCase):
 
@@ -44,3 +49,38 @@ a:
 
         with self.assertRaises(FrontMatterError):
             split_front_matter_and_markup("""---\na:\n2\n---\n# Document""")
+
+    def test_read_front_matter(self):
+        texts = [
+            "# Document",
+            "\n\n---\na:\n  b: 2\n---\n# Document\n\n",
+            "---\n# Document",
+            "---\na: 2\n# Document",
+            "---\na: 2\n---\n",
+            "---\na: 2\n---\n\n\n",
+            "---\na: 2\n---\n# Document",
+            "---\n---\n# Document\nmore",
+            "---\na: 2\n# Document\nmore\nlines",
+        ]
+        for text in texts:
+            front_matter, num_lines = read_front_matter(StringIO(text))
+            self.assertEqual(
+                split_front_matter_and_markup(text),
+                (front_matter, strip_front_matter_lines(text, num_lines)),
+                f"for {repr(text)}",
+            )
+
+    def test_read_front_matter_only(self):
+        fp = StringIO("---\ntitle: Title\n---\n# Document\n" + "text\n" * 1000)
+        self.assertEqual(({"title": "Title"}, 3), read_front_matter(fp))
+        # only one more line is read to check the minimum text length
+        self.assertEqual("text\n" * 1000, fp.read())
+
+    def test_lazy_markup(self):
+        markup = Markup.from_file(DATA_PATH / "front_matter.md")
+        self.assertEqual({"title": "The Title", "slug": "the-slug"}, markup.front_matter)
+        self.assertIsNone(markup._markup_template)
+        self.assertEqual(
+            split_front_matter_and_markup((DATA_PATH / "front_matter.md").read_text())[1],
+            markup.markup_template,
+        )
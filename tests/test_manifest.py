@@ -0,0 +1,50 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from impro.manifest import BuildManifest
+from impro.site import Site
+from impro.pages import Page
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+
+
+class TestManifest(unittest.TestCase):
+
+    def build(self, source_dir: Path, output_dir: Path, *names: str) -> BuildManifest:
+        site = Site()
+        site.add_page(*(Page.from_file(source_dir / name) for name in names))
+        manifest = BuildManifest.load(output_dir)
+        site.write_files(output_dir, "html", manifest=manifest)
+        return manifest
+
+    def test_incremental(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source_dir = Path(tmp) / "source"
+            output_dir = Path(tmp) / "output"
+            shutil.copytree(DATA_DIR, source_dir)
+
+            manifest = self.build(source_dir, output_dir, "images_no_fm.md", "sub_fm.md", "with_css.md")
+            self.assertEqual(
+                ["/image1.png", "/sub-path/image2.png", "/images-no-fm.html",
+                 "/sub-fm.html", "/style.css", "/with-css.html"],
+                manifest.rebuilt,
+            )
+            self.assertEqual([], manifest.skipped)
+
+            manifest = self.build(source_dir, output_dir, "images_no_fm.md", "sub_fm.md", "with_css.md")
+            self.assertEqual([], manifest.rebuilt)
+            self.assertEqual(6, len(manifest.skipped))
+
+            # changing an extended template
+            (source_dir / "base.md").write_text((source_dir / "base.md").read_text() + "\nmore")
+            # changing an asset
+            (source_dir / "style.css").write_text("body {}")
+            # removing a page
+            manifest = self.build(source_dir, output_dir, "images_no_fm.md", "sub_fm.md")
+            self.assertEqual(["/sub-fm.html"], manifest.rebuilt)
+            self.assertEqual(["/with-css.html", "/style.css"], manifest.deleted)
+            self.assertIn("more", (output_dir / "sub-fm.html").read_text())
+            self.assertFalse((output_dir / "style.css").exists())
+            self.assertTrue((output_dir / "image1.png").exists())
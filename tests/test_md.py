@@ -0,0 +1,66 @@
+import unittest
+
+from impro.pages.md import replace_markdown_links
+
+
+class TestMarkdown(unittest.TestCase):
+
+    def test_replace_links(self):
+        mapping = {"image.png": "/docs/image.png", "a.md": "/a.html", "b.md": "/b.html"}
+        self.assertEqual(
+            """# Links
+
+![image](/docs/image.png) and [a](/a.html "title") and [<a>](</a.html>)
+[c](c.md) and (a.md) and [nested](image.png(1))
+
+Code `[a](a.md)` and ``x `[a](a.md)` y``.
+
+```markdown
+[a](a.md)
+```
+
+~~~~
+![image](image.png)
+~~~~
+
+[ref]: /b.html "title"
+""",
+            replace_markdown_links("""# Links
+
+![image](image.png) and [a](a.md "title") and [<a>](<a.md>)
+[c](c.md) and (a.md) and [nested](image.png(1))
+
+Code `[a](a.md)` and ``x `[a](a.md)` y``.
+
+```markdown
+[a](a.md)
+```
+
+~~~~
+![image](image.png)
+~~~~
+
+[ref]: b.md "title"
+""", mapping)
+        )
+
+    def test_unclosed_code_span(self):
+        self.assertEqual(
+            "a ` b\n\n[a](/a.html) `c`\n",
+            replace_markdown_links("a ` b\n\n[a](a.md) `c`\n", {"a.md": "/a.html"}),
+        )
+
+    def test_indented_code_and_comments(self):
+        mapping = {"a.md": "/a.html"}
+        self.assertEqual("text\n\n    [a](a.md)\n", replace_markdown_links("text\n\n    [a](a.md)\n", mapping))
+        self.assertEqual(
+            "    [a](a.md)\n\n\tb [a](a.md)\n\n[a](/a.html)\n<!-- [a](a.md)\n-->\n",
+            replace_markdown_links("    [a](a.md)\n\n\tb [a](a.md)\n\n[a](a.md)\n<!-- [a](a.md)\n-->\n", mapping),
+        )
+        # not a code block: paragraph continuation, list item content and fenced content
+        self.assertEqual(
+            "text\n    [a](/a.html)\n\n- item\n\n    [a](/a.html)\n\n```\n\n    [a](a.md)\n```\n",
+            replace_markdown_links(
+                "text\n    [a](a.md)\n\n- item\n\n    [a](a.md)\n\n```\n\n    [a](a.md)\n```\n", mapping,
+            ),
+        )
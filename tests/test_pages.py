@@ -2,6 +2,7 @@ import unittest
 from pathlib import Path
 
 from impro.pages import Page
+from impro.pages.markup import Markup
 
 
 DATA_PATH = Path(__file__).resolve().parent / "data"
@@ -90,3 +91,45 @@ Here is ![image 2](./sub-path/image2.png).
 """,
             page.to_md()
         )
+
+    def test_html_link_mapping(self):
+        page = Page.from_file(DATA_PATH / "images_no_fm.md")
+        elements = page.elements
+        html = page.markup.to_html(link_mapping={"image1.png": "/assets/image1.png"})
+        self.assertIn('src="/assets/image1.png"', html)
+        self.assertIn('src="./sub-path/image2.png"', html)
+        # the shared document is not modified by the mapping
+        self.assertIs(elements, page.elements)
+        self.assertIn('src="image1.png"', page.markup.to_html())
+
+    def test_shared_layout(self):
+        page1 = Page.from_file(DATA_PATH / "front_matter.md")
+        page2 = Page.from_file(DATA_PATH / "no_front_matter.md")
+        html1 = page1.to_html()
+        html2 = page2.to_html()
+        self.assertIn("<title>The Title</title>", html1)
+        self.assertIn("<title>headline 1</title>", html2)
+        self.assertIs(
+            Markup.from_layout("base.html", format="html", env=page1.env),
+            Markup.from_layout("base.html", format="html", env=page2.env),
+        )
+
+    def test_markup_contexts(self):
+        markup = Markup.from_string("# {{ title }}\n", format="md")
+        self.assertEqual("# One\n", markup.markup({"title": "One"}))
+        self.assertEqual("# Two\n", markup.markup({"title": "Two"}))
+        self.assertEqual("Two", markup.get_elements({"title": "Two"})["headings"][0]["text"])
+        self.assertEqual("One", markup.get_elements({"title": "One"})["headings"][0]["text"])
+
+        # variables that the template does not refer to are not part of the key
+        self.assertEqual(
+            markup.render_key({"title": "One"}),
+            markup.render_key({"title": "One", "other": 1}),
+        )
+
+        # variables of extended templates
+        page = Page.from_file(DATA_PATH / "sub_fm.md")
+        markup = page.markup
+        self.assertEqual({"title", "slug"}, markup.template_variables(page.env))
+        self.assertIn("-- A --", markup.markup({"title": "A"}, page.env))
+        self.assertIn("-- B --", markup.markup({"title": "B"}, page.env))
@@ -0,0 +1,230 @@
+import http.client
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from impro.pages import Page
+from impro.server import SiteServer
+from impro.site import Site
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+
+
+class TestServer(unittest.TestCase):
+
+    def start_server(self, site: Site = None, **kwargs) -> SiteServer:
+        if site is None:
+            site = Site()
+            site.add_page(
+                Page.from_file(DATA_DIR / "front_matter.md"),
+                Page.from_file(DATA_DIR / "images_no_fm.md"),
+                Page.from_file(DATA_DIR / "with_css.md"),
+            )
+        server = SiteServer(("127.0.0.1", 0), site, **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_keep_alive(self):
+        server = self.start_server()
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_port)
+
+        connection.request("GET", "/the-slug.html")
+        response = connection.getresponse()
+        self.assertEqual(200, response.status)
+        self.assertEqual("text/html", response.getheader("Content-type"))
+        self.assertIn(b"<title>The Title</title>", response.read())
+
+        connection.request("GET", "/image1.png?query")
+        response = connection.getresponse()
+        self.assertEqual(200, response.status)
+        self.assertEqual("image/png", response.getheader("Content-type"))
+        self.assertEqual((DATA_DIR / "image1.png").read_bytes(), response.read())
+
+        connection.request("GET", "/missing.html")
+        response = connection.getresponse()
+        self.assertEqual(404, response.status)
+        self.assertIn(b'href="/the-slug.html"', response.read())
+
+        connection.close()
+
+    def test_lazy_rendering(self):
+        server = self.start_server(cache_size=1)
+        self.assertEqual({"/the-slug.html", "/images-no-fm.html", "/with-css.html"}, set(server.routes))
+        self.assertEqual(0, len(server._cache))
+
+        server.get_file("/the-slug.html")
+        server.get_file("/images-no-fm.html")
+        self.assertEqual(["/images-no-fm.html"], list(server._cache))
+        self.assertEqual({"/image1.png", "/sub-path/image2.png"}, set(server.assets))
+
+        # associated file of a page that was not rendered yet
+        self.assertEqual(DATA_DIR / "style.css", server.get_file("/style.css")["content"].path)
+
+    def test_concurrent_rendering(self):
+        server = self.start_server()
+        site = server.site
+        render_page = site.render_page
+        slow_started, slow_release = threading.Event(), threading.Event()
+
+        def _render_page(key, format):
+            if key == "the-slug":
+                slow_started.set()
+                slow_release.wait(5)
+            return render_page(key, format)
+
+        site.render_page = _render_page
+        thread = threading.Thread(target=server.get_file, args=("/the-slug.html", ))
+        thread.start()
+        self.assertTrue(slow_started.wait(5))
+
+        # other pages are not blocked by the slow page
+        self.assertIsNotNone(server.get_file("/with-css.html"))
+        self.assertTrue(thread.is_alive())
+        slow_release.set()
+        thread.join()
+        self.assertIn("/the-slug.html", server._cache)
+
+    def test_update_during_rendering(self):
+        server = self.start_server()
+        site = server.site
+        render_page = site.render_page
+        render_started, render_release = threading.Event(), threading.Event()
+
+        def _render_page(key, format):
+            render_started.set()
+            render_release.wait(5)
+            return render_page(key, format)
+
+        site.render_page = _render_page
+        thread = threading.Thread(target=server.get_file, args=("/the-slug.html", ))
+        thread.start()
+        self.assertTrue(render_started.wait(5))
+
+        # the routes are not swapped while a page is rendered
+        routes = {path: key for path, key in server.routes.items() if key != "the-slug"}
+        site.page_routes = lambda format: routes
+        update = threading.Thread(target=server.update_pages, args=(["the-slug"], ))
+        update.start()
+        update.join(.2)
+        self.assertTrue(update.is_alive())
+        self.assertIn("/the-slug.html", server.routes)
+        render_release.set()
+        thread.join()
+        update.join()
+        self.assertNotIn("/the-slug.html", server.routes)
+        self.assertNotIn("/the-slug.html", server._cache)
+
+        # a route that is gone when the render starts
+        self.assertIsNone(server._render_page("/the-slug.html"))
+
+    def test_concurrent_asset_hashing(self):
+        server = self.start_server()
+        server.get_file("/the-slug.html")
+        server.get_file("/images-no-fm.html")
+        hash_started, hash_release = threading.Event(), threading.Event()
+
+        def _hash_file(path):
+            hash_started.set()
+            hash_release.wait(5)
+            return "hash"
+
+        with mock.patch("impro.server.hash_file", _hash_file):
+            thread = threading.Thread(target=server.get_file, args=("/image1.png", ))
+            thread.start()
+            self.assertTrue(hash_started.wait(5))
+
+            # cached pages are not blocked by the hashing
+            self.assertIsNotNone(server.get_file("/the-slug.html"))
+            self.assertTrue(thread.is_alive())
+            hash_release.set()
+            thread.join()
+        self.assertEqual("hash", server.get_file("/image1.png")["etag"])
+
+    def test_conditional_requests(self):
+        server = self.start_server()
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_port)
+
+        for path in ("/the-slug.html", "/image1.png"):
+            connection.request("HEAD", path)
+            response = connection.getresponse()
+            self.assertEqual(200, response.status)
+            self.assertEqual(b"", response.read())
+            self.assertEqual("no-cache", response.getheader("Cache-Control"))
+            etag = response.getheader("ETag")
+            last_modified = response.getheader("Last-Modified")
+            length = int(response.getheader("Content-Length"))
+
+            connection.request("GET", path)
+            response = connection.getresponse()
+            self.assertEqual(length, len(response.read()))
+            self.assertEqual(etag, response.getheader("ETag"))
+
+            connection.request("GET", path, headers={"If-None-Match": f'"other", {etag}'})
+            response = connection.getresponse()
+            self.assertEqual(304, response.status)
+            self.assertEqual(b"", response.read())
+
+            connection.request("GET", path, headers={"If-None-Match": '"other"'})
+            response = connection.getresponse()
+            self.assertEqual(200, response.status)
+            response.read()
+
+            connection.request("GET", path, headers={"If-Modified-Since": last_modified})
+            response = connection.getresponse()
+            self.assertEqual(304, response.status)
+            response.read()
+
+        connection.close()
+
+    def test_deleted_asset(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            (Path(tmp) / "page.md").write_text("# Page\n\n![image](image.png)\n")
+            (Path(tmp) / "image.png").write_bytes(b"\x89PNG")
+            site = Site()
+            site.add_page(Page.from_file(Path(tmp) / "page.md"))
+            server = self.start_server(site)
+            connection = http.client.HTTPConnection("127.0.0.1", server.server_port)
+
+            connection.request("GET", "/image.png")
+            response = connection.getresponse()
+            self.assertEqual(b"\x89PNG", response.read())
+
+            (Path(tmp) / "image.png").unlink()
+            for method in ("GET", "HEAD"):
+                connection.request(method, "/image.png")
+                response = connection.getresponse()
+                response.read()
+                self.assertEqual(404, response.status)
+            self.assertEqual({}, server._asset_info)
+            connection.close()
+
+    def test_immutable_fingerprinted_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            (Path(tmp) / "deadbeef12.md").write_text("# Looks like a hash\n")
+            site = Site(fingerprint_path="/assets")
+            site.add_page(
+                Page.from_file(DATA_DIR / "images_no_fm.md"),
+                Page.from_file(Path(tmp) / "deadbeef12.md"),
+            )
+            server = self.start_server(site)
+            connection = http.client.HTTPConnection("127.0.0.1", server.server_port)
+
+            for path in ("/deadbeef12.html", "/images-no-fm.html"):
+                connection.request("GET", path)
+                response = connection.getresponse()
+                response.read()
+                self.assertEqual("no-cache", response.getheader("Cache-Control"), path)
+
+            self.assertTrue(server.assets)
+            for path in server.assets:
+                self.assertTrue(path.startswith("/assets/"))
+                connection.request("GET", path)
+                response = connection.getresponse()
+                self.assertEqual(200, response.status)
+                response.read()
+                self.assertEqual("public, max-age=31536000, immutable", response.getheader("Cache-Control"))
+            connection.close()
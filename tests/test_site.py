@@ -1,6 +1,9 @@
+import json
+import tempfile
 import unittest
 from pathlib import Path
 
+from impro import site as site_module
 from impro.site import Site
 from impro.pages import Page
 from impro.writer import MemoryWriter
@@ -46,3 +49,101 @@ class TestSite(unittest.TestCase):
              "/image1.png", "/sub-path/image2.png"},
             filenames,
         )
+
+    def test_site_writer_parallel(self):
+        site = Site()
+        site.add_page(
+            Page.from_file(DATA_DIR / "no_front_matter.md"),
+            Page.from_file(DATA_DIR / "images_no_fm.md"),
+            Page.from_file(DATA_DIR / "with_css.md"),
+            Page.from_file(DATA_DIR / "sub_fm.md"),
+        )
+        for format in ("md", "html"):
+            serial = list(site.iter_files(format))
+            parallel = list(site.iter_files(format, workers=2))
+            self.assertEqual(serial, parallel)
+
+    def test_site_index(self):
+        site = Site()
+        site.add_page(
+            Page.from_file(DATA_DIR / "front_matter.md"),
+            Page.from_file(DATA_DIR / "images_no_fm.md"),
+            path="docs",
+        )
+        index = site.index()
+        self.assertEqual(
+            {
+                "key": "docs/the-slug",
+                "path": "docs",
+                "slug": "the-slug",
+                "filename": "/docs/the-slug.html",
+                "title": "The Title",
+                "front_matter": {"title": "The Title", "slug": "the-slug"},
+                "headings": [{"level": 1, "text": "headline 1"}, {"level": 2, "text": "headline 2"}],
+                "links": ["#headline-1", "https://targ.et"],
+                "files": [],
+            },
+            index[0],
+        )
+        self.assertEqual(
+            [
+                {"type": "image", "path": "image1.png", "external": False},
+                {"type": "image", "path": "./sub-path/image2.png", "external": False},
+                {"type": "image", "path": "http://subgenius.com/Graffix/dobbs.jpg", "external": True},
+            ],
+            index[1]["files"],
+        )
+        self.assertEqual(index, json.loads(json.dumps(index)))
+
+    def test_from_directory(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            for name in ("index.md", "guide/intro.md", "guide/deep/more.md", "guide/notes.txt",
+                         ".hidden/secret.md", "drafts/draft.md"):
+                (root / name).parent.mkdir(parents=True, exist_ok=True)
+                (root / name).write_text(f"# {name}\n")
+
+            site = Site.from_directory(root)
+            self.assertEqual(
+                ["index", "drafts/draft", "guide/intro", "guide/deep/more"],
+                site.page_keys(),
+            )
+
+            site = Site.from_directory(root, exclude=[".*", "drafts"], path="docs")
+            self.assertEqual(
+                {
+                    "/docs/index.html": "docs/index",
+                    "/docs/guide/intro.html": "docs/guide/intro",
+                    "/docs/guide/deep/more.html": "docs/guide/deep/more",
+                },
+                site.page_routes("html"),
+            )
+
+            site = Site.from_directory(root, include=["guide/*.md"], workers=2)
+            self.assertEqual(["guide/intro", "guide/deep/more"], site.page_keys())
+
+    def test_fingerprint_assets(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            image = (DATA_DIR / "image1.png").read_bytes()
+            for name in ("a/page.md", "b/page.md"):
+                (root / name).parent.mkdir(parents=True)
+                (root / name).write_text("# Title\n\n![logo](logo.png)\n")
+                (root / name).with_name("logo.png").write_bytes(image)
+
+            site = Site.from_directory(root, fingerprint_path="/assets")
+            writer = site.write_files("/", "md", writer=MemoryWriter)
+
+            assets = [filename for filename in writer.files if filename.parts[1] == "assets"]
+            self.assertEqual(1, len(assets))
+            self.assertRegex(str(assets[0]), r"^/assets/[0-9a-f]{16}\.png$")
+            for filename in ("/a/page.md", "/b/page.md"):
+                self.assertIn(f"![logo]({assets[0]})", writer.files[Path(filename)])
+
+            # the hash of an edited file replaces the previous one
+            (root / "a" / "logo.png").write_bytes(image + b"\x00")
+            writer = site.write_files("/", "md", writer=MemoryWriter)
+            assets = [filename for filename in writer.files if filename.parts[1] == "assets"]
+            self.assertEqual(2, len(assets))
+            hashed = [path for path in site_module._file_hashes if root.resolve() in path.resolve().parents]
+            self.assertEqual(2, len(hashed))
@@ -0,0 +1,92 @@
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from impro import stats
+from impro.site import Site
+from impro.pages import Page
+from impro.stats import BuildStats
+from impro.writer import MemoryWriter
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+
+
+class TestStats(unittest.TestCase):
+
+    def build(self, workers=None) -> BuildStats:
+        site = Site()
+        site.add_page(
+            Page.from_file(DATA_DIR / "images_no_fm.md"),
+            Page.from_file(DATA_DIR / "with_css.md"),
+        )
+        with BuildStats() as build_stats:
+            site.write_files("/", "html", writer=MemoryWriter, workers=workers)
+        return build_stats
+
+    def test_inactive(self):
+        self.assertIsNone(stats.active())
+        with stats.stage("a"), stats.page("b"):
+            stats.count("c")
+
+        with BuildStats() as build_stats:
+            self.assertIs(build_stats, stats.active())
+        self.assertIsNone(stats.active())
+
+    def test_nested_stages(self):
+        with BuildStats() as build_stats:
+            with stats.page("page"):
+                with stats.stage("outer"):
+                    time.sleep(.02)
+                    with stats.stage("inner"):
+                        time.sleep(.02)
+            stats.count("things", 3)
+
+        self.assertEqual({"outer", "inner"}, set(build_stats.stages))
+        self.assertGreaterEqual(build_stats.stages["inner"]["wall"], .02)
+        # nested time is not included in the outer stage
+        self.assertLess(build_stats.stages["outer"]["wall"], .035)
+        self.assertEqual({"things": 3}, build_stats.counters)
+        self.assertEqual(["page"], [p["page"] for p in build_stats.slowest_pages()])
+        self.assertEqual({"outer", "inner"}, set(build_stats.pages["page"]["stages"]))
+
+    def test_site(self):
+        for workers in (None, 2):
+            build_stats = self.build(workers=workers)
+            self.assertEqual(
+                ["/images-no-fm.html", "/with-css.html"],
+                sorted(build_stats.pages),
+            )
+            for name in ("page", "markdown_parse", "html_render", "layout", "write"):
+                self.assertIn(name, build_stats.stages)
+            self.assertEqual(5, build_stats.counters["files_written"])
+            self.assertGreater(build_stats.counters["bytes_written"], 0)
+            self.assertGreater(build_stats.counters["bytes_read"], 0)
+
+            report = build_stats.report(top=1)
+            self.assertEqual(2, report["num_pages"])
+            self.assertEqual(1, len(report["slowest_pages"]))
+
+    def test_threads(self):
+        outer_started, inner_done = threading.Event(), threading.Event()
+
+        def _other_thread():
+            with stats.page("other"), stats.stage("other"):
+                outer_started.wait(5)
+                with stats.stage("other_inner"):
+                    time.sleep(.02)
+                inner_done.set()
+
+        with BuildStats() as build_stats:
+            thread = threading.Thread(target=_other_thread)
+            thread.start()
+            with stats.page("page"), stats.stage("outer"):
+                outer_started.set()
+                # a stage of another thread is not nested into this one
+                inner_done.wait(5)
+            thread.join()
+
+        self.assertEqual({"outer", "other", "other_inner"}, set(build_stats.stages))
+        self.assertGreaterEqual(build_stats.stages["outer"]["wall"], .02)
+        self.assertEqual({"outer"}, set(build_stats.pages["page"]["stages"]))
+        self.assertEqual({"other", "other_inner"}, set(build_stats.pages["other"]["stages"]))
@@ -0,0 +1,172 @@
+import os
+import re
+import sys
+import tempfile
+import types
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from impro.pages import Page
+from impro.site import Site
+from impro import styles
+from impro.styles import scss_imports, styles_key, minify_css, bundle_styles, compile_scss, rebase_urls
+from impro.writer import MemoryWriter
+
+
+class TestStyles(unittest.TestCase):
+
+    def test_scss_imports(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp)
+            (path / "partials").mkdir()
+            (path / "main.scss").write_text('@import "partials/colors", "reset.css";\nbody { color: $c; }\n')
+            (path / "partials" / "_colors.scss").write_text('@import "fonts";\n$c: red;\n')
+            (path / "partials" / "fonts.scss").write_text('@import "_colors";\n')
+
+            self.assertEqual(
+                [path / "partials" / "_colors.scss", path / "partials" / "fonts.scss"],
+                scss_imports(path / "main.scss"),
+            )
+
+            key = styles_key([path / "main.scss"])
+            self.assertNotEqual(key, styles_key([path / "main.scss"], minify=True))
+            (path / "partials" / "fonts.scss").write_text('@import "_colors";\n$f: serif;\n')
+            self.assertNotEqual(key, styles_key([path / "main.scss"]))
+
+    def test_styles_key_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = Path(tmp) / "a.css"
+            filename.write_text("a { color: red; }")
+            key = styles_key([filename])
+            with mock.patch("impro.styles.hash_file") as hash_file:
+                self.assertEqual(key, styles_key([filename]))
+                hash_file.assert_not_called()
+
+            filename.write_text("a { color: blue; }")
+            os.utime(filename, ns=(0, 0))
+            self.assertNotEqual(key, styles_key([filename]))
+            self.assertEqual(1, len([f for f in styles._source_hashes if f == filename]))
+
+    def test_rebase_urls(self):
+        self.assertEqual(
+            'a{background:url(/docs/img/bg.png)} b{src:url("/docs/css/fonts/x.woff?v=1#f")}'
+            " c{src:url('/abs.png') url(data:image/png;base64,AA) url(https://x.org/a.png) url(#id)}",
+            rebase_urls(
+                'a{background:url(../img/bg.png)} b{src:url( "fonts/x.woff?v=1#f" )}'
+                " c{src:url('/abs.png') url(data:image/png;base64,AA) url(https://x.org/a.png) url(#id)}",
+                "/docs/css",
+            ),
+        )
+
+    def test_minify_css(self):
+        self.assertEqual(
+            "a,b>i{color:red;margin:0 auto}\n",
+            minify_css("/* comment */\na, b > i {\n    color: red;\n    margin: 0 auto;\n}\n"),
+        )
+
+    def test_bundle(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp)
+            (path / "a.css").write_text("a { color: red; }")
+            (path / "b.css").write_text("b { color: blue; }\n")
+            for name in ("page1.md", "page2.md"):
+                (path / name).write_text("---\ncss:\n  - a.css\n  - b.css\n---\n# Title\n")
+            (path / "page3.md").write_text("---\ncss: a.css\n---\n# Title\n")
+
+            bundle = bundle_styles([path / "a.css", path / "b.css"], path / "bundles")
+            self.assertEqual("a { color: red; }\nb { color: blue; }\n", bundle.read_text())
+
+            site = Site(css_bundle_path="/css", minify_css=True, style_cache_path=path / "bundles")
+            site.add_page(*(Page.from_file(path / name) for name in ("page1.md", "page2.md", "page3.md")))
+            writer = site.write_files("/", "html", writer=MemoryWriter)
+
+            bundles = sorted(str(f) for f in writer.files if f.parts[1] == "css")
+            self.assertEqual(2, len(bundles))
+            contents = {writer.files[Path(f)].decode() for f in bundles}
+            self.assertEqual({"a{color:red}\n", "a{color:red}\nb{color:blue}\n"}, contents)
+
+            links = [
+                re.findall(r'rel="stylesheet" href="([^"]+)"', writer.files[Path(f"/page{i}.html")])
+                for i in (1, 2, 3)
+            ]
+            self.assertEqual(1, len(links[0]))
+            self.assertIn(links[0][0], bundles)
+            self.assertEqual(links[0], links[1])
+            self.assertNotEqual(links[0], links[2])
+
+            # relative urls are rebased to the location of the stylesheet without bundling
+            (path / "css").mkdir()
+            (path / "css" / "c.css").write_text("c { background: url(../img/bg.png); }\n")
+            (path / "page4.md").write_text("---\ncss: css/c.css\n---\n# Title\n")
+            site.add_page(Page.from_file(path / "page4.md"), path="docs")
+            rendered = site.render_page("docs/page4", "html")
+            self.assertEqual(
+                "c{background:url(/docs/img/bg.png)}\n",
+                rendered["files"][0]["real_path"].read_text(),
+            )
+
+            # md output keeps the stylesheets
+            writer = site.write_files("/", "md", writer=MemoryWriter)
+            self.assertIn(Path("/a.css"), writer.files)
+
+    def test_bundle_scss(self):
+        compilers = []
+
+        class Compiler:
+            # replaces "$c" by the value of the last "$c: value;" in the file or it's imports
+            def __init__(self, root, search_path, output_style):
+                self.root = root
+                compilers.append(output_style)
+
+            def compile_string(self, source):
+                for name in re.findall(r'@import "([^"]+)";', source):
+                    source = (self.root / f"_{name}.scss").read_text() + source
+                source = re.sub(r'@import [^;]+;\n', "", source)
+                values = re.findall(r"\$c: ([^;]+);", source)
+                source = re.sub(r"\$c: [^;]+;\n", "", source)
+                return source.replace("$c", values[-1])
+
+        scss = types.ModuleType("scss")
+        scss.Compiler = Compiler
+
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.dict(sys.modules, {"scss": scss}):
+            path = Path(tmp)
+            (path / "_colors.scss").write_text("$c: red;\n")
+            (path / "main.scss").write_text('@import "colors";\na { color: $c; }\n')
+            (path / "b.css").write_text("b { color: blue; }\n")
+            (path / "page.md").write_text("---\ncss:\n  - main.scss\n  - b.css\n---\n# Title\n")
+
+            site = Site(css_bundle_path="/css", minify_css=True, style_cache_path=path / "bundles")
+            site.add_page(Page.from_file(path / "page.md"))
+            writer = site.write_files("/", "html", writer=MemoryWriter)
+            bundles = [f for f in writer.files if f.parts[1] == "css"]
+            self.assertEqual(1, len(bundles))
+            self.assertEqual(b"a{color:red}\nb{color:blue}\n", writer.files[bundles[0]])
+            self.assertEqual(["compressed"], compilers)
+            self.assertIn(f'href="{bundles[0]}"', writer.files[Path("/page.html")])
+
+            # a changed import results in a new bundle
+            (path / "_colors.scss").write_text("$c: green;\n")
+            writer = site.write_files("/", "html", writer=MemoryWriter)
+            new_bundles = [f for f in writer.files if f.parts[1] == "css"]
+            self.assertNotEqual(bundles, new_bundles)
+            self.assertEqual(b"a{color:green}\nb{color:blue}\n", writer.files[new_bundles[0]])
+
+    def test_scss_import_errors(self):
+        class BrokenModule(types.ModuleType):
+            def __getattr__(self, name):
+                raise re.error("global flags not at the start of the expression")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = Path(tmp) / "main.scss"
+            filename.write_text("a { color: red; }\n")
+            for module, message in (
+                    (None, "pyScss is required to compile"),
+                    (BrokenModule("scss"), "pyScss is not compatible with python"),
+            ):
+                with mock.patch.dict(sys.modules, {"scss": module}):
+                    with self.assertRaises(ImportError) as e:
+                        compile_scss(filename)
+                    self.assertIn(message, str(e.exception))
+                    self.assertIn(str(filename), str(e.exception))
@@ -0,0 +1,111 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from impro.pages import Page
+from impro.site import Site
+from impro.watch import SiteWatcher, watch_and_write
+from impro.writer import BackgroundWriter, SyncFileWriter
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+
+
+class TestWatch(unittest.TestCase):
+
+    def touch(self, filename: Path, content: str):
+        mtime = filename.stat().st_mtime_ns
+        filename.write_text(content)
+        os.utime(filename, ns=(mtime + 10**9, mtime + 10**9))
+
+    def test_site_watcher(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source_dir = Path(tmp)
+            for name in ("base.md", "sub_fm.md", "no_front_matter.md", "images_no_fm.md", "image1.png"):
+                shutil.copy(DATA_DIR / name, source_dir / name)
+            (source_dir / "sub-path").mkdir()
+            shutil.copy(DATA_DIR / "sub-path" / "image2.png", source_dir / "sub-path")
+
+            site = Site()
+            site.add_page(
+                Page.from_file(source_dir / "sub_fm.md"),
+                Page.from_file(source_dir / "no_front_matter.md"),
+                Page.from_file(source_dir / "images_no_fm.md"),
+            )
+            watcher = SiteWatcher(site, "md", associated_files=True)
+            self.assertEqual(set(), watcher.watcher.poll())
+
+            # template change
+            self.touch(source_dir / "base.md", "# base {{title}}\n{% block content %}{% endblock %}")
+            keys, files = watcher.apply(watcher.wait())
+            self.assertEqual(["sub-fm"], keys)
+            self.assertEqual([], files)
+            self.assertEqual("# base SubGenius\n\nThis Is Sub!\n", site.render_page("sub-fm", "md")["content"])
+
+            # page change with new slug
+            self.touch(source_dir / "no_front_matter.md", "---\nslug: new-slug\n---\n# new")
+            keys, files = watcher.apply(watcher.wait())
+            self.assertEqual(["new-slug"], keys)
+            self.assertEqual(["sub-fm", "new-slug", "images-no-fm"], site.page_keys())
+
+            # associated file change
+            self.touch(source_dir / "image1.png", "image")
+            keys, files = watcher.apply(watcher.wait())
+            self.assertEqual([], keys)
+            self.assertEqual([("/image1.png", (source_dir / "image1.png").resolve())], files)
+
+    def test_bundled_styles(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source_dir = Path(tmp)
+            (source_dir / "a.css").write_text("a { color: red; }\n")
+            (source_dir / "main.scss").write_text('@import "colors";\n')
+            (source_dir / "_colors.scss").write_text("$c: red;\n")
+            (source_dir / "p.md").write_text("---\ncss: a.css\n---\n# P\n")
+            (source_dir / "q.md").write_text("---\ncss: main.scss\n---\n# Q\n")
+            (source_dir / "r.md").write_text("# R\n")
+
+            site = Site(css_bundle_path="/css")
+            site.add_page(*(Page.from_file(source_dir / name) for name in ("p.md", "q.md", "r.md")))
+            bundle = site.render_page("p", "html")["files"][0]
+            # only watching the pages does not compile the scss, which requires pyScss
+            watcher = SiteWatcher(site, "html")
+
+            self.touch(source_dir / "a.css", "a { color: blue; }\n")
+            keys, files = watcher.apply(watcher.wait())
+            self.assertEqual(["p"], keys)
+            new_bundle = site.render_page("p", "html")["files"][0]
+            self.assertNotEqual(bundle["export_path"], new_bundle["export_path"])
+            self.assertEqual("a { color: blue; }\n", new_bundle["real_path"].read_text())
+
+            # scss imports are watched too
+            self.touch(source_dir / "_colors.scss", "$c: blue;\n")
+            keys, files = watcher.apply(watcher.wait())
+            self.assertEqual(["q"], keys)
+
+    def test_watch_and_write_sync(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source_dir, output = Path(tmp) / "src", Path(tmp) / "out"
+            source_dir.mkdir()
+            (source_dir / "page.md").write_text("---\nslug: old\n---\n# Page\n")
+            site = Site()
+            site.add_page(Page.from_file(source_dir / "page.md"))
+            writer = site.write_files(output, "html", writer=BackgroundWriter(SyncFileWriter(output)))
+
+            def _wait(watcher):
+                if not changes:
+                    raise KeyboardInterrupt
+                return changes.pop(0)
+
+            self.touch(source_dir / "page.md", "---\nslug: new\n---\n# Page\n")
+            changes = [{(source_dir / "page.md").resolve()}]
+            with mock.patch.object(SiteWatcher, "wait", _wait), self.assertRaises(KeyboardInterrupt):
+                watch_and_write(site, "html", writer)
+
+            # files written while watching are listed after each round
+            self.assertEqual(
+                ["new.html", "old.html"],
+                json.loads((output / SyncFileWriter.FILE_LIST).read_text()),
+            )
@@ -0,0 +1,198 @@
+import io
+import os
+import tarfile
+import tempfile
+import zipfile
+import unittest
+from pathlib import Path
+
+from impro.files import SourceFile, COPY_MODES
+from impro.pages import Page
+from impro.site import Site
+from impro.excpetions import WriteError
+from impro.writer import (
+    FileWriter, SyncFileWriter, MemoryWriter, BackgroundWriter, TarWriter, ZipWriter, archive_format, archive_writer,
+    _content_size,
+)
+
+
+class TestWriter(unittest.TestCase):
+
+    def test_sync_writer(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            (root / "user.txt").write_text("not written by impro")
+
+            writer = SyncFileWriter(root)
+            writer.write("/old/stale.html", "stale")
+            writer.write("/same.html", "same")
+            writer.write("/kept.html", "kept")
+            writer.close()
+            self.assertEqual([], writer.deleted)
+            mtime = (root / "same.html").stat().st_mtime_ns
+
+            writer = SyncFileWriter(root)
+            writer.write("/same.html", "same")
+            writer.write("/changed.html", "changed")
+            writer.write("/sub/image.png", b"\x00\x01")
+            writer.keep("/kept.html")
+            writer.close()
+
+            self.assertEqual([root / "same.html"], writer.unchanged)
+            self.assertEqual([root / "changed.html", root / "sub" / "image.png"], writer.files)
+            self.assertEqual([root / "old" / "stale.html"], writer.deleted)
+            self.assertEqual(mtime, (root / "same.html").stat().st_mtime_ns)
+            self.assertEqual(
+                [SyncFileWriter.FILE_LIST, "changed.html", "kept.html", "same.html", "sub", "user.txt"],
+                sorted(os.listdir(root)),
+            )
+            self.assertEqual(["image.png"], os.listdir(root / "sub"))
+
+            # files are only deleted when listed by a previous run
+            writer = SyncFileWriter(root / "sub")
+            writer.write("/other.png", b"\x00")
+            writer.close()
+            self.assertEqual([], writer.deleted)
+            self.assertTrue((root / "sub" / "image.png").exists())
+
+    def test_source_file_copy_modes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = Path(tmp) / "source.bin"
+            source.write_bytes(bytes(range(256)) * 1000)
+
+            for mode in COPY_MODES:
+                root = Path(tmp) / mode
+                writer = FileWriter(root, copy_mode=mode)
+                writer.write("/sub/file.bin", SourceFile(source))
+                self.assertEqual(source.read_bytes(), (root / "sub" / "file.bin").read_bytes())
+
+            self.assertTrue(os.path.samefile(source, Path(tmp) / "hardlink" / "sub" / "file.bin"))
+            self.assertFalse(os.path.samefile(source, Path(tmp) / "copy" / "sub" / "file.bin"))
+
+    def test_copy_after_hardlink(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = Path(tmp) / "source.bin"
+            source.write_bytes(b"data" * 1000)
+            root = Path(tmp) / "out"
+            FileWriter(root, copy_mode="hardlink").write("/file.bin", SourceFile(source))
+
+            for mode in ("copy", "reflink"):
+                FileWriter(root, copy_mode=mode).write("/file.bin", SourceFile(source))
+                self.assertEqual(b"data" * 1000, source.read_bytes())
+                self.assertEqual(b"data" * 1000, (root / "file.bin").read_bytes())
+                self.assertFalse(os.path.samefile(source, root / "file.bin"))
+
+    def test_memory_writer_reads_source_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = Path(tmp) / "source.bin"
+            source.write_bytes(b"data")
+            writer = MemoryWriter()
+            writer.write("/file.bin", SourceFile(source))
+            self.assertEqual({Path("/file.bin"): b"data"}, writer.files)
+
+    def test_archive_writers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = Path(tmp) / "image.png"
+            source.write_bytes(b"\x89PNG" * 100)
+
+            for format in ("zip", "tar", "tar.gz"):
+                filename = Path(tmp) / f"site.{format}"
+                writer = archive_writer(filename, mtime=0)
+                writer.write("/index.html", "<p>ü</p>")
+                writer.write("/img/image.png", SourceFile(source))
+                writer.close()
+                self.assertEqual(["index.html", "img/image.png"], writer.files)
+
+                if format == "zip":
+                    with zipfile.ZipFile(filename) as zf:
+                        self.assertEqual(["index.html", "img/image.png"], zf.namelist())
+                        self.assertEqual("<p>ü</p>", zf.read("index.html").decode("utf-8"))
+                        self.assertEqual(source.read_bytes(), zf.read("img/image.png"))
+                        self.assertEqual(zipfile.ZIP_STORED, zf.getinfo("img/image.png").compress_type)
+                else:
+                    with tarfile.open(filename) as tf:
+                        self.assertEqual(["index.html", "img/image.png"], tf.getnames())
+                        self.assertEqual(source.read_bytes(), tf.extractfile("img/image.png").read())
+
+        # streaming
+        stream = io.BytesIO()
+        writer = TarWriter(stream, compression="gz")
+        writer.write("/a.md", "# a")
+        writer.close()
+        with tarfile.open(fileobj=io.BytesIO(stream.getvalue())) as tf:
+            self.assertEqual(b"# a", tf.extractfile("a.md").read())
+
+        self.assertEqual("tar.gz", archive_format("out/site.TAR.GZ"))
+        self.assertEqual("zip", archive_format("site.zip"))
+        self.assertIsNone(archive_format("site"))
+        with self.assertRaises(NotImplementedError):
+            ZipWriter(io.BytesIO()).remove("/a.md")
+
+    def test_archive_abort(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp)
+            (path / "page.md").write_text("# Page\n\n![image](missing.png)\n")
+            site = Site()
+            site.add_page(Page.from_file(path / "page.md"))
+
+            for filename in ("site.zip", "site.tar.gz"):
+                for background in (False, True):
+                    writer = archive_writer(path / filename)
+                    if background:
+                        writer = BackgroundWriter(writer)
+                    writer.write("/other.html", "<p>other</p>")
+                    with self.assertRaises(IOError):
+                        site.write_files("/", "html", writer=writer)
+                    self.assertEqual(["page.md"], os.listdir(path))
+
+            writer = ZipWriter(path / "site.zip")
+            writer.write("/a.md", "# a")
+            self.assertFalse((path / "site.zip").exists())
+            writer.close()
+            self.assertEqual(["page.md", "site.zip"], sorted(os.listdir(path)))
+
+    def test_background_writer(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            writer = BackgroundWriter(FileWriter(root), workers=3, max_bytes=10)
+            for i in range(20):
+                writer.write(f"/dir{i % 3}/file{i}.txt", f"content {i}")
+            writer.flush()
+            self.assertEqual(20, len(writer.files))
+            self.assertEqual(0, writer._bytes_in_flight)
+            writer.remove("/dir0/file0.txt")
+            writer.close()
+            self.assertEqual("content 19", (root / "dir1" / "file19.txt").read_text())
+            self.assertFalse((root / "dir0" / "file0.txt").exists())
+
+            # errors are raised at the end
+            (root / "blocker").write_text("not a directory")
+            writer = BackgroundWriter(FileWriter(root))
+            writer.write("/blocker/file.txt", "x")
+            writer.write("/fine.txt", "x")
+            with self.assertRaises(WriteError) as e:
+                writer.close()
+            self.assertEqual(["/blocker/file.txt"], [f for f, _ in e.exception.errors])
+            self.assertTrue((root / "fine.txt").exists())
+
+            # a failed archive is closed and removed
+            writer = BackgroundWriter(ZipWriter(root / "failed.zip"))
+            writer.write("/a.txt", "a")
+            writer.write("/b.txt", SourceFile(root / "missing.bin"))
+            with self.assertRaises(WriteError):
+                writer.close()
+            self.assertTrue(writer.writer._zip.fp is None)
+            self.assertFalse(any(f.name.startswith((".failed.zip", "failed.zip")) for f in root.iterdir()))
+
+            # str contents are counted by their encoded size
+            self.assertEqual(6, _content_size("äöü"))
+            self.assertEqual(3, _content_size(b"abc"))
+
+            # archives are written by one thread, in order
+            writer = BackgroundWriter(ZipWriter(root / "site.zip"), workers=4)
+            self.assertEqual(1, writer.workers)
+            for i in range(10):
+                writer.write(f"/{i}.txt", str(i))
+            writer.close()
+            with zipfile.ZipFile(root / "site.zip") as zf:
+                self.assertEqual([f"{i}.txt" for i in range(10)], zf.namelist())